@@ -1,22 +1,125 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 import os
+import zlib
+
+from app.utils.metrics import instrument_engine
 
 # Tạo thư mục data nếu chưa có
 os.makedirs("data", exist_ok=True)
 
-# Kết nối SQLite database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/sales_management.db"
+# Kết nối database (mặc định SQLite trong thư mục data)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/sales_management.db")
 
-# Tạo engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Cần thiết cho SQLite
+# URL cho engine async (route handler), mặc định dùng aiosqlite với cùng file SQLite
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
 )
 
+# Cấu hình SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Kích thước connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Dùng engine riêng (chỉ đọc) cho các request GET
+DB_READ_ENGINE = os.getenv("DB_READ_ENGINE", "1") == "1"
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Tăng khi sửa trigger/bảng FTS hoặc các hàm setup_* trong init_db
+# (thay đổi bảng, cột, index của model được nhận ra tự động qua DDL)
+SCHEMA_VERSION = 2
+
+
+def _sqlite_pragmas(read_only: bool = False):
+    """Listener áp dụng PRAGMA mỗi khi SQLite mở kết nối mới"""
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: người đọc không bị chặn bởi người ghi
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Với WAL, NORMAL vẫn an toàn khi app bị dừng, chỉ fsync khi checkpoint
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Giá trị âm: đơn vị KB
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return set_sqlite_pragmas
+
+
+def _create_engine(read_only: bool = False):
+    """Tạo engine theo cấu hình, với SQLite thì áp dụng PRAGMA mỗi khi mở kết nối"""
+    if not IS_SQLITE:
+        new_engine = create_engine(
+            SQLALCHEMY_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        instrument_engine(new_engine)
+        return new_engine
+
+    new_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,  # Cần thiết cho SQLite
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(new_engine, "connect", _sqlite_pragmas(read_only))
+    instrument_engine(new_engine)
+    return new_engine
+
+
+def _create_async_engine(read_only: bool = False):
+    """Tạo engine async (aiosqlite với SQLite), cùng cấu hình pool và PRAGMA"""
+    connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000} if IS_SQLITE else {}
+    new_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args=connect_args,
+        # aiosqlite mặc định không giữ kết nối (NullPool), dùng pool để tái sử dụng kết nối
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if IS_SQLITE:
+        event.listen(new_engine.sync_engine, "connect", _sqlite_pragmas(read_only))
+    instrument_engine(new_engine.sync_engine)
+    return new_engine
+
+
+# Tạo engine
+engine = _create_engine()
+
+# Engine chỉ đọc: pool riêng nên request đọc không phải chờ kết nối của request ghi
+read_engine = _create_engine(read_only=True) if DB_READ_ENGINE else engine
+
 # Tạo SessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Engine async cho route handler: truy vấn không chặn event loop
+async_engine = _create_async_engine()
+async_read_engine = _create_async_engine(read_only=True) if DB_READ_ENGINE else async_engine
+
+# expire_on_commit=False: vẫn đọc được thuộc tính sau commit mà không cần truy vấn lại
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 # Base class cho models
 Base = declarative_base()
@@ -29,7 +132,100 @@ def get_db():
     finally:
         db.close()
 
-def init_db():
-    """Khởi tạo database và tạo các bảng"""
+def get_read_db():
+    """Dependency để lấy database session chỉ đọc (dùng cho request GET)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """Dependency để lấy AsyncSession (dùng trong route handler)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    """Dependency để lấy AsyncSession chỉ đọc (dùng cho request GET)"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+async def dispose_async_engines():
+    """Đóng các kết nối async khi tắt ứng dụng"""
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+def add_missing_columns(bind, metadata):
+    """Thêm các cột mới vào bảng đã tồn tại (create_all không làm việc này)
+
+    Cột NOT NULL phải có server_default để SQLite điền giá trị cho dữ liệu cũ.
+    """
+    from sqlalchemy import inspect, text
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(ddl))
+
+def schema_fingerprint(metadata) -> int:
+    """Dấu của schema hiện tại (SCHEMA_VERSION + DDL các bảng/index), lưu trong PRAGMA user_version"""
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    ddl = [str(SCHEMA_VERSION)]
+    for table in metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            ddl.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+    # user_version là số nguyên có dấu 32 bit, 0 = database mới/chưa đánh dấu
+    return zlib.crc32("\n".join(ddl).encode("utf-8")) & 0x7FFFFFFF or 1
+
+def invalidate_schema_version(conn):
+    """Buộc init_db lần sau kiểm tra lại toàn bộ schema (sau khi gỡ bảng, index hoặc trigger)"""
+    if IS_SQLITE:
+        conn.exec_driver_sql("PRAGMA user_version = 0")
+
+def init_db(force: bool = False) -> bool:
+    """Khởi tạo database và tạo các bảng
+
+    Với SQLite, nếu PRAGMA user_version khớp dấu schema hiện tại thì bỏ qua
+    create_all, kiểm tra cột/index và tạo trigger (mỗi lần khởi động chỉ tốn
+    một truy vấn). Trả về True nếu đã chạy đầy đủ các bước.
+    """
     from app.models import Base
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    from app.utils.category_stats import setup_category_stats
+    from app.utils.data_version import setup_data_versions
+    from app.utils.image_store import setup_image_refs
+    from app.utils.search import detect_search_index, setup_search_index
+
+    fingerprint = schema_fingerprint(Base.metadata) if IS_SQLITE else None
+    if fingerprint is not None and not force:
+        with engine.connect() as conn:
+            current = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if current == fingerprint:
+            detect_search_index(engine)
+            return False
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, Base.metadata)
+    # create_all không thêm index mới cho bảng đã tồn tại
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    setup_data_versions(engine)
+    setup_category_stats(engine)
+    setup_image_refs(engine)
+    setup_search_index(engine)
+    if fingerprint is not None:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+    return True 
\ No newline at end of file
@@ -2,10 +2,20 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+import asyncio
 import os
+import re
 
-from app.database import init_db
+from app.database import dispose_async_engines, init_db
 from app.routes import product
+from app.utils.audit_log import flush_audit_logs
+from app.utils.image_store import orphan_gc_loop
+from app.utils.log_retention import retention_loop
+from app.utils.metrics import MetricsMiddleware, render_metrics
+from app.utils.templates import precompile_templates
+from app.utils.thumbnails import shutdown_thumbnail_pool
+from app.utils.uploads import MAX_UPLOAD_BYTES, is_content_addressed
 
 # Khởi tạo FastAPI app
 app = FastAPI(
@@ -23,11 +33,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Form thêm/sửa sản phẩm (có upload ảnh)
+UPLOAD_PATH = re.compile(r"^/products/?(\d+)?$")
+# Phần dư cho các trường text trong form multipart
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Từ chối request upload quá lớn dựa vào Content-Length, trước khi đọc body"""
+    if request.method == "POST" and UPLOAD_PATH.match(request.url.path):
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": "Dung lượng upload quá lớn"})
+    return await call_next(request)
+
+# Đo thời gian và số câu SQL mỗi request (thêm sau cùng để bao ngoài mọi middleware khác)
+app.add_middleware(MetricsMiddleware)
+
 # Tạo thư mục static nếu chưa có
 os.makedirs("static", exist_ok=True)
 os.makedirs("static/uploads", exist_ok=True)
 
-# Mount static files
+class UploadStaticFiles(StaticFiles):
+    """Ảnh đặt tên theo hash nội dung không bao giờ thay đổi nên cho trình duyệt cache vĩnh viễn"""
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if is_content_addressed(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+# Mount static files (uploads mount trước để được ưu tiên)
+app.mount("/static/uploads", UploadStaticFiles(directory="static/uploads"), name="uploads")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Include routers
@@ -38,11 +75,30 @@ async def root():
     """Trang chủ - chuyển hướng đến danh sách sản phẩm"""
     return {"message": "Hệ thống Quản lý Bán hàng", "redirect": "/products"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Số liệu request/truy vấn theo định dạng Prometheus"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
 async def startup_event():
     """Khởi tạo database khi ứng dụng khởi động"""
     init_db()
     print("✅ Database đã được khởi tạo thành công!")
+    precompile_templates()
+    # Dọn log cũ theo lịch, ngoài request
+    app.state.retention_task = asyncio.create_task(retention_loop())
+    # Dọn file ảnh không còn tham chiếu (request lỗi sau khi đã lưu ảnh)
+    app.state.orphan_gc_task = asyncio.create_task(orphan_gc_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dừng task dọn log/ảnh, ghi nốt log đang chờ, dừng process pool tạo thumbnail, đóng kết nối khi tắt ứng dụng"""
+    app.state.retention_task.cancel()
+    app.state.orphan_gc_task.cancel()
+    flush_audit_logs()
+    shutdown_thumbnail_pool()
+    await dispose_async_engines()
 
 if __name__ == "__main__":
     import uvicorn
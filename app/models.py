@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Boolean, Column, Integer, String, Float, Text, DateTime, ForeignKey, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,6 +15,9 @@ class Product(Base):
     sku = Column(String(100), unique=True, nullable=False, comment="Mã SKU")
     price = Column(Float, nullable=False, comment="Giá tiền")
     quantity = Column(Integer, default=0, comment="Số lượng trong kho")
+    reorder_threshold = Column(Integer, nullable=False, default=5, server_default="5", comment="Ngưỡng cảnh báo sắp hết hàng")
+    threshold_override = Column(Boolean, nullable=False, default=False, server_default="0",
+                                comment="Ngưỡng đặt riêng cho sản phẩm (không theo danh mục)")
     category = Column(String(100), comment="Nhóm/danh mục")
     description = Column(Text, comment="Mô tả sản phẩm")
     images = Column(JSON, default=list, comment="Danh sách đường dẫn ảnh")
@@ -24,6 +27,15 @@ class Product(Base):
     # Quan hệ với log
     logs = relationship("ProductLog", back_populates="product", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Index cho keyset pagination theo (created_at, id)
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_category_created_at_id", "category", "created_at", "id"),
+        # Partial index chỉ chứa sản phẩm dưới ngưỡng cảnh báo
+        Index("ix_products_low_stock", "category", "quantity",
+              sqlite_where=text("quantity < reorder_threshold")),
+    )
+    
     def to_dict(self):
         """Chuyển đổi thành dictionary"""
         return {
@@ -32,6 +44,8 @@ class Product(Base):
             "sku": self.sku,
             "price": self.price,
             "quantity": self.quantity,
+            "reorder_threshold": self.reorder_threshold,
+            "threshold_override": self.threshold_override,
             "category": self.category,
             "description": self.description,
             "images": self.images or [],
@@ -55,6 +69,15 @@ class ProductLog(Base):
     # Quan hệ với sản phẩm
     product = relationship("Product", back_populates="logs")
     
+    __table_args__ = (
+        # Index cho việc xóa log cũ theo lô và lọc theo khoảng thời gian
+        Index("ix_product_logs_created_at", "created_at"),
+        # Lịch sử một sản phẩm và lọc theo hành động/trường, đều sắp xếp theo thời gian
+        Index("ix_product_logs_product_id_created_at", "product_id", "created_at"),
+        Index("ix_product_logs_action_created_at", "action", "created_at"),
+        Index("ix_product_logs_field_name_created_at", "field_name", "created_at"),
+    )
+    
     def to_dict(self):
         """Chuyển đổi thành dictionary"""
         return {
@@ -66,4 +89,64 @@ class ProductLog(Base):
             "new_value": self.new_value,
             "changed_by": self.changed_by,
             "created_at": self.created_at.isoformat() if self.created_at else None
-        } 
\ No newline at end of file
+        } 
+
+class StockMovement(Base):
+    """Log gọn cho mỗi lần điều chỉnh tồn kho (một dòng cho mỗi sản phẩm trong một lần gọi API)"""
+    __tablename__ = "stock_movements"
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="ID sản phẩm")
+    delta = Column(Integer, nullable=False, comment="Số lượng thay đổi (âm là xuất kho)")
+    quantity_after = Column(Integer, nullable=False, comment="Số lượng sau khi điều chỉnh")
+    changed_by = Column(String(100), default="admin", comment="Người thay đổi")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="Thời gian điều chỉnh")
+    
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_created_at", "product_id", "created_at"),
+    )
+    
+    def to_dict(self):
+        """Chuyển đổi thành dictionary"""
+        return {
+            "id": self.id,
+            "product_id": self.product_id,
+            "delta": self.delta,
+            "quantity_after": self.quantity_after,
+            "changed_by": self.changed_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class DataVersion(Base):
+    """Bộ đếm phiên bản dữ liệu theo bảng, tăng bằng trigger mỗi khi bảng thay đổi"""
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True, comment="Tên bảng")
+    version = Column(Integer, nullable=False, default=0, comment="Số lần thay đổi")
+
+class CategoryStat(Base):
+    """Thống kê theo danh mục, được cập nhật tăng dần bằng trigger trên bảng products"""
+    __tablename__ = "category_stats"
+    
+    category = Column(String(100), primary_key=True, comment="Danh mục ('' = chưa phân loại)")
+    product_count = Column(Integer, nullable=False, default=0, comment="Số sản phẩm")
+    total_quantity = Column(Integer, nullable=False, default=0, comment="Tổng số lượng trong kho")
+    low_stock_count = Column(Integer, nullable=False, default=0, comment="Số sản phẩm sắp hết hàng")
+    reorder_threshold = Column(Integer, comment="Ngưỡng cảnh báo mặc định cho danh mục")
+    
+    def to_dict(self):
+        """Chuyển đổi thành dictionary"""
+        return {
+            "category": self.category,
+            "product_count": self.product_count,
+            "total_quantity": self.total_quantity,
+            "low_stock_count": self.low_stock_count,
+            "reorder_threshold": self.reorder_threshold
+        }
+
+class ImageRef(Base):
+    """Số sản phẩm đang dùng mỗi file ảnh (ảnh lưu theo hash nội dung nên có thể dùng chung)"""
+    __tablename__ = "image_refs"
+    
+    filename = Column(String(100), primary_key=True, comment="Tên file trong static/uploads")
+    ref_count = Column(Integer, nullable=False, default=0, comment="Số sản phẩm tham chiếu")
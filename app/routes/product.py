@@ -1,239 +1,242 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-import os
-import shutil
-from datetime import datetime, timedelta
-from PIL import Image
-import uuid
+from urllib.parse import urlencode
+from datetime import datetime
 
-from app.database import get_db
-from app.models import Product, ProductLog
-from app.utils.export_excel import export_products_to_excel
+from app.database import get_async_db, get_async_read_db
+from app.models import Product
+from app.utils.audit_log import changed_fields, log_entry, write_product_logs
+from app.utils.category_stats import get_category_stats, summarize
+from app.utils.etag import check_not_modified, etag_headers
+from app.utils.export_excel import XLSX_MEDIA_TYPE, stream_products_excel
+from app.utils.export_jobs import get_job, job_filepath, job_progress, submit_export_job
+from app.utils.history import LOG_ACTIONS, LOG_FIELDS, log_page, parse_date, product_names
+from app.utils.importer import import_file
+from app.utils.log_retention import get_retention_stats
+from app.utils.low_stock import apply_threshold, low_stock_condition, set_category_threshold
+from app.utils.pagination import PAGE_SIZE, MAX_PAGE_SIZE, keyset_page
+from app.utils.product_cache import (
+    cached_product_by_sku, clear_product_cache, get_product, invalidate_product, product_cache_stats,
+)
+from app.utils.search import apply_search, products_fts
+from app.utils.stock import STOCK_ADJUST_MAX_DELTA, StockAdjustmentError, adjust_stock, delete_stock_movements
+from app.utils.templates import TEMPLATE_VERSION, card_cache, invalidate_card, render_stream, thumbnails_ready
+from app.utils.thumbnails import schedule_thumbnails
+from app.utils.image_store import acquire_images, collect_garbage, release_images
+from app.utils.uploads import UploadError, save_images
 
 router = APIRouter()
 
-# Tạo thư mục uploads nếu chưa có
-UPLOAD_DIR = "static/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Các cột trả về qua JSON API (id, created_at luôn có để tạo cursor)
+API_FIELDS = ("id", "name", "sku", "price", "quantity", "category", "created_at", "updated_at")
 
-def create_product_log(db: Session, product_id: int, action: str, field_name: str = None, 
-                      old_value: str = None, new_value: str = None, changed_by: str = "admin"):
-    """Tạo log thay đổi sản phẩm"""
-    log = ProductLog(
-        product_id=product_id,
-        action=action,
-        field_name=field_name,
-        old_value=old_value,
-        new_value=new_value,
-        changed_by=changed_by
-    )
-    db.add(log)
-    db.commit()
-    return log
+async def store_images(images: List[UploadFile]):
+    """Lưu ảnh upload và lên lịch tạo thumbnail, chuyển lỗi upload thành HTTPException"""
+    try:
+        image_paths = await save_images(images)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    schedule_thumbnails(image_paths)
+    return image_paths
 
-def cleanup_old_logs(db: Session):
-    """Xóa log cũ hơn 15 ngày"""
-    cutoff_date = datetime.utcnow() - timedelta(days=15)
-    db.query(ProductLog).filter(ProductLog.created_at < cutoff_date).delete()
-    db.commit()
+async def _sku_taken(db: AsyncSession, sku: str, exclude_id: int = None) -> bool:
+    """SKU đã thuộc sản phẩm khác: dùng cache nếu có, nếu không tra index UNIQUE của sku"""
+    owner = cached_product_by_sku(sku)
+    if owner is not None:
+        return owner.id != exclude_id
+    query = select(Product.id).where(Product.sku == sku)
+    if exclude_id is not None:
+        query = query.where(Product.id != exclude_id)
+    return await db.scalar(query) is not None
 
-@router.get("/", response_class=HTMLResponse)
-async def list_products(request: Request, search: str = "", category: str = "", message: str = "", db: Session = Depends(get_db)):
-    """Hiển thị danh sách sản phẩm với tìm kiếm và filter theo danh mục"""
-    # Xây dựng query base
-    query = db.query(Product)
-    
+def _is_sku_conflict(error: IntegrityError) -> bool:
+    """Lỗi ghi do trùng SKU (ràng buộc UNIQUE của products.sku)"""
+    return "sku" in str(error.orig).lower()
+
+def filter_products(query, search: str = "", category: str = "", low_stock: bool = False):
+    """Áp dụng filter danh mục, sắp hết hàng và tìm kiếm, trả về (query, ranked)"""
     # Filter theo danh mục
     if category:
         query = query.filter(Product.category == category)
-    
-    # Tìm kiếm sản phẩm theo tên hoặc SKU
+
+    # Chỉ sản phẩm dưới ngưỡng cảnh báo (dùng partial index)
+    if low_stock:
+        query = query.filter(low_stock_condition())
+
+    # Tìm kiếm sản phẩm theo tên hoặc SKU (FTS5, fallback ilike)
+    ranked = False
     if search:
-        query = query.filter(
-            (Product.name.ilike(f"%{search}%")) | 
-            (Product.sku.ilike(f"%{search}%"))
+        query, ranked = apply_search(query, search)
+    return query, ranked
+
+def paginate_products(query, ranked: bool, cursor: str, limit: int, key_of):
+    """Phân trang keyset: theo độ liên quan khi tìm kiếm FTS5, ngược lại theo (created_at, id)"""
+    if ranked:
+        keys = [(products_fts.c.rank, False), (Product.id, False)]
+    else:
+        keys = [(Product.created_at, True), (Product.id, True)]
+    try:
+        return keyset_page(query, keys, key_of, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def load_product_list(db: Session, search: str, category: str, cursor: str, low_stock: bool):
+    """Truy vấn dữ liệu cho trang danh sách (chạy qua AsyncSession.run_sync)
+
+    Trả về (products, next_cursor, stats, total_count, low_stock_count).
+    """
+    base_query, ranked = filter_products(db.query(Product), search, category, low_stock)
+
+    # Lấy một trang sản phẩm (kèm điểm xếp hạng khi tìm kiếm FTS5)
+    if ranked:
+        rows, next_cursor = paginate_products(
+            base_query.add_columns(products_fts.c.rank), ranked, cursor, PAGE_SIZE,
+            lambda row: (row.rank, row.Product.id)
         )
+        products = [row.Product for row in rows]
+    else:
+        products, next_cursor = paginate_products(
+            base_query, ranked, cursor, PAGE_SIZE, lambda p: (p.created_at, p.id)
+        )
+
+    # Thống kê theo danh mục (dropdown + số lượng), không quét bảng products
+    stats = get_category_stats(db)
+    total_count, low_stock_count = summarize(stats, category)
+
+    # Khi tìm kiếm thì phải đếm trên kết quả tìm kiếm
+    if search:
+        total_count = base_query.count()
+        low_stock_count = base_query.filter(low_stock_condition()).count()
+    elif low_stock:
+        total_count = low_stock_count
+
+    return products, next_cursor, stats, total_count, low_stock_count
+
+@router.get("/", response_class=HTMLResponse)
+async def list_products(request: Request, search: str = "", category: str = "", message: str = "",
+                        cursor: str = "", low_stock: bool = False, db: AsyncSession = Depends(get_async_read_db)):
+    """Hiển thị danh sách sản phẩm với tìm kiếm và filter theo danh mục"""
+    # Trả 304 nếu dữ liệu chưa đổi, trước khi truy vấn sản phẩm
+    etag, not_modified = await check_not_modified(request, db, ("products",), TEMPLATE_VERSION)
+    if not_modified:
+        return not_modified
+
+    products, next_cursor, stats, total_count, low_stock_count = await db.run_sync(
+        load_product_list, search, category, cursor, low_stock
+    )
+    category_stats = [stat for stat in stats if stat.category]
+
+    # Link phân trang giữ nguyên điều kiện tìm kiếm
+    page_params = {k: v for k, v in {"search": search, "category": category, "low_stock": int(low_stock)}.items() if v}
+    next_url = f"/products?{urlencode({**page_params, 'cursor': next_cursor})}" if next_cursor else ""
+    first_url = f"/products?{urlencode(page_params)}" if page_params else "/products"
+    low_stock_url = f"/products?{urlencode({**page_params, 'low_stock': 1})}"
+
+    # Card dùng ảnh gốc khi thumbnail chưa tạo xong: không gửi ETag để lần sau nhận HTML có thumbnail
+    cacheable = thumbnails_ready(product.images[0] for product in products if product.images)
+
+    return render_stream(
+        "products/list.html",
+        headers=etag_headers(etag, cacheable),
+        products=products,
+        category_stats=category_stats,
+        total_count=total_count,
+        low_stock_count=low_stock_count,
+        search=search,
+        category=category,
+        message=message,
+        cursor=cursor,
+        low_stock=low_stock,
+        next_url=next_url,
+        first_url=first_url,
+        low_stock_url=low_stock_url,
+    )
+
+@router.get("/api")
+async def list_products_api(request: Request, response: Response, search: str = "", category: str = "",
+                            cursor: str = "", limit: int = PAGE_SIZE, fields: str = "",
+                            db: AsyncSession = Depends(get_async_read_db)):
+    """JSON API danh sách sản phẩm, chỉ select các cột cần thiết và phân trang bằng cursor"""
+    # Chọn cột trả về, luôn kèm id và created_at để tạo cursor
+    requested = [f.strip() for f in fields.split(",") if f.strip()] or list(API_FIELDS)
+    invalid = [f for f in requested if f not in API_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Trường không hợp lệ: {', '.join(invalid)}")
+    selected = list(dict.fromkeys(["id", "created_at", *requested]))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
     
-    # Lấy danh sách sản phẩm
-    products = query.order_by(Product.created_at.desc()).all()
+    columns = [getattr(Product, f) for f in selected]
+
+    etag, not_modified = await check_not_modified(request, db, ("products",))
+    if not_modified:
+        return not_modified
+    response.headers.update(etag_headers(etag))
+
+    def load_page(session: Session):
+        query, ranked = filter_products(session.query(*columns), search, category)
+        if ranked:
+            query = query.add_columns(products_fts.c.rank)
+            key_of = lambda row: (row.rank, row.id)
+        else:
+            key_of = lambda row: (row.created_at, row.id)
+        return paginate_products(query, ranked, cursor, limit, key_of)
+
+    rows, next_cursor = await db.run_sync(load_page)
     
-    # Lấy danh sách danh mục để hiển thị trong dropdown
-    categories = db.query(Product.category).distinct().filter(Product.category.isnot(None)).all()
-    category_list = [cat[0] for cat in categories if cat[0]]
+    items = []
+    for row in rows:
+        item = {f: getattr(row, f) for f in selected}
+        for f in ("created_at", "updated_at"):
+            if item.get(f):
+                item[f] = item[f].isoformat()
+        items.append(item)
     
-    # Kiểm tra sản phẩm có số lượng thấp
-    low_stock_products = [p for p in products if p.quantity < 5]
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
+
+@router.get("/low-stock")
+async def low_stock_report(category: str = "", cursor: str = "", limit: int = PAGE_SIZE,
+                           db: AsyncSession = Depends(get_async_read_db)):
+    """Báo cáo sản phẩm dưới ngưỡng cảnh báo (dùng partial index), sắp xếp theo số lượng tăng dần"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    def load_page(session: Session):
+        query = session.query(
+            Product.id, Product.name, Product.sku, Product.category,
+            Product.quantity, Product.reorder_threshold
+        ).filter(low_stock_condition())
+        if category:
+            query = query.filter(Product.category == category)
+        keys = [(Product.quantity, False), (Product.id, False)]
+        return keyset_page(query, keys, lambda row: (row.quantity, row.id), cursor, limit)
+
+    try:
+        rows, next_cursor = await db.run_sync(load_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Sales Management</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-4">
-            <div class="d-flex justify-content-between align-items-center mb-4">
-                <h1><i class="fas fa-box"></i> Sales Management</h1>
-                <div>
-                    <a href="/products/new" class="btn btn-primary">
-                        <i class="fas fa-plus"></i> Thêm sản phẩm
-                    </a>
-                    <a href="/products/export" class="btn btn-success">
-                        <i class="fas fa-file-excel"></i> Xuất Excel
-                    </a>
-                </div>
-            </div>
-            
-            <!-- Form tìm kiếm và filter -->
-            <div class="row mb-4">
-                <div class="col-md-8">
-                    <form method="get" class="d-flex">
-                        <input type="text" name="search" value="{search}" class="form-control me-2" 
-                               placeholder="Tìm kiếm theo tên hoặc mã SKU...">
-                        <select name="category" class="form-select me-2" style="min-width: 150px;">
-                            <option value="">Tất cả danh mục</option>
-                            {''.join([f'<option value="{cat}" {"selected" if cat == category else ""}>{cat}</option>' for cat in category_list])}
-                        </select>
-                        <button type="submit" class="btn btn-outline-primary">
-                            <i class="fas fa-search"></i> Tìm
-                        </button>
-                        {f'<a href="/products" class="btn btn-outline-secondary ms-2">Xóa filter</a>' if search or category else ''}
-                    </form>
-                </div>
-                <div class="col-md-4 text-end">
-                    <span class="text-muted">Tìm thấy {len(products)} sản phẩm</span>
-                </div>
-            </div>
-            
-            {f'<div class="alert alert-warning"><i class="fas fa-exclamation-triangle"></i> Có {len(low_stock_products)} sản phẩm có số lượng dưới 5!</div>' if low_stock_products else ''}
-            
-            {f'<div class="alert alert-success"><i class="fas fa-check-circle"></i> {message}</div>' if message else ''}
-            
-            {f'<div class="alert alert-info"><i class="fas fa-search"></i> Kết quả tìm kiếm cho: "{search}"</div>' if search else ''}
-            
-            {f'<div class="alert alert-info"><i class="fas fa-filter"></i> Đang lọc theo danh mục: "{category}"</div>' if category else ''}
-            
-            {f'<div class="alert alert-warning"><i class="fas fa-exclamation-triangle"></i> Không tìm thấy sản phẩm nào phù hợp với điều kiện tìm kiếm</div>' if (search or category) and not products else ''}
-            
-            <div class="row">
-                {''.join([f'''
-                <div class="col-md-4 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">{product.name}</h5>
-                            <p class="card-text">
-                                <strong>SKU:</strong> {product.sku}<br>
-                                <strong>Giá:</strong> {product.price:,.0f} VNĐ<br>
-                                <strong>Số lượng:</strong> 
-                                <span class="{'text-danger' if product.quantity < 5 else 'text-success'}">
-                                    {product.quantity}
-                                </span><br>
-                                <strong>Danh mục:</strong> {product.category or 'N/A'}<br>
-                                <strong>Mô tả:</strong> {product.description or 'N/A'}
-                            </p>
-                            {f'<div class="mb-2"><img src="/static/uploads/{product.images[0]}" class="img-thumbnail" style="max-height: 100px;"></div>' if product.images else ''}
-                        </div>
-                        <div class="card-footer">
-                            <a href="/products/{product.id}/edit" class="btn btn-sm btn-warning">
-                                <i class="fas fa-edit"></i> Sửa
-                            </a>
-                            <a href="/products/{product.id}/logs" class="btn btn-sm btn-info">
-                                <i class="fas fa-history"></i> Lịch sử
-                            </a>
-                            <button onclick="deleteProduct({product.id})" class="btn btn-sm btn-danger">
-                                <i class="fas fa-trash"></i> Xóa
-                            </button>
-                        </div>
-                    </div>
-                </div>
-                ''' for product in products])}
-            </div>
-        </div>
-        
-        <script>
-        function deleteProduct(id) {{
-            if (confirm('Bạn có chắc muốn xóa sản phẩm này?')) {{
-                fetch(`/products/${{id}}`, {{method: 'DELETE'}})
-                    .then(response => response.json())
-                    .then(data => {{
-                        if (data.success) {{
-                            location.reload();
-                        }} else {{
-                            alert('Có lỗi xảy ra: ' + data.message);
-                        }}
-                    }})
-                    .catch(error => {{
-                        console.error('Error:', error);
-                        alert('Có lỗi xảy ra khi xóa sản phẩm');
-                    }});
-            }}
-        }}
-        </script>
-    </body>
-    </html>
-    """
+    items = [{**row._asdict(), "shortfall": row.reorder_threshold - row.quantity} for row in rows]
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
+
+@router.post("/low-stock/thresholds")
+async def update_category_threshold(category: str = Form(...), threshold: int = Form(..., ge=0),
+                                    db: AsyncSession = Depends(get_async_db)):
+    """Đặt ngưỡng cảnh báo cho danh mục, áp dụng cho sản phẩm trong danh mục chưa có ngưỡng riêng"""
+    updated = await db.run_sync(set_category_threshold, category, threshold)
+    await db.commit()
+    clear_product_cache()
+    return {"success": True, "category": category, "threshold": threshold, "updated": updated}
 
 @router.get("/new", response_class=HTMLResponse)
 async def new_product_form():
     """Form thêm sản phẩm mới"""
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Thêm sản phẩm mới</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-4">
-            <h1><i class="fas fa-plus"></i> Thêm sản phẩm mới</h1>
-            <form action="/products" method="post" enctype="multipart/form-data">
-                <div class="row">
-                    <div class="col-md-6">
-                        <div class="mb-3">
-                            <label class="form-label">Tên sản phẩm *</label>
-                            <input type="text" name="name" class="form-control" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Mã SKU *</label>
-                            <input type="text" name="sku" class="form-control" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Giá tiền *</label>
-                            <input type="number" name="price" class="form-control" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Số lượng trong kho</label>
-                            <input type="number" name="quantity" class="form-control" value="0">
-                        </div>
-                    </div>
-                    <div class="col-md-6">
-                        <div class="mb-3">
-                            <label class="form-label">Danh mục</label>
-                            <input type="text" name="category" class="form-control">
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Mô tả</label>
-                            <textarea name="description" class="form-control" rows="3"></textarea>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Ảnh sản phẩm (tối đa 5 ảnh)</label>
-                            <input type="file" name="images" class="form-control" multiple accept=".jpg,.jpeg,.png,.webp">
-                        </div>
-                    </div>
-                </div>
-                <div class="mt-3">
-                    <button type="submit" class="btn btn-primary">Thêm sản phẩm</button>
-                    <a href="/products" class="btn btn-secondary">Hủy</a>
-                </div>
-            </form>
-        </div>
-    </body>
-    </html>
-    """
+    return render_stream("products/form.html", product=None)
 
 @router.post("/")
 async def create_product(
@@ -243,29 +246,17 @@ async def create_product(
     quantity: int = Form(0),
     category: str = Form(""),
     description: str = Form(""),
+    reorder_threshold: Optional[int] = Form(None),
     images: List[UploadFile] = File([]),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Tạo sản phẩm mới"""
-    # Kiểm tra SKU đã tồn tại
-    existing_product = db.query(Product).filter(Product.sku == sku).first()
-    if existing_product:
+    # Kiểm tra SKU trước khi lưu ảnh (cache hoặc tra index UNIQUE của sku)
+    if await _sku_taken(db, sku):
         raise HTTPException(status_code=400, detail="SKU đã tồn tại")
     
-    # Xử lý upload ảnh
-    image_paths = []
-    for image in images[:5]:  # Giới hạn 5 ảnh
-        if image.filename:
-            # Tạo tên file unique
-            file_ext = os.path.splitext(image.filename)[1]
-            filename = f"{uuid.uuid4()}{file_ext}"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-            
-            # Lưu file
-            with open(filepath, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-            
-            image_paths.append(filename)
+    # Xử lý upload ảnh (stream theo chunk, giới hạn dung lượng)
+    image_paths = await store_images(images)
     
     # Tạo sản phẩm
     product = Product(
@@ -277,80 +268,74 @@ async def create_product(
         description=description,
         images=image_paths
     )
+    await db.run_sync(apply_threshold, product, category, reorder_threshold)
     
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.run_sync(acquire_images, image_paths)
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        # SKU vừa bị request khác dùng: ảnh vừa lưu không ai dùng được task dọn ảnh xóa sau
+        await db.rollback()
+        if not _is_sku_conflict(e):
+            raise
+        raise HTTPException(status_code=400, detail="SKU đã tồn tại")
     
-    # Tạo log
-    create_product_log(db, product.id, "create", changed_by="admin")
+    # Tạo log trong cùng transaction
+    await db.run_sync(write_product_logs, [log_entry(product.id, "create", changed_by="admin")])
+    await db.commit()
     
     return RedirectResponse(url="/products?message=Sản phẩm đã được tạo thành công!", status_code=303)
 
+@router.post("/import")
+async def import_products(file: UploadFile = File(...)):
+    """Nhập sản phẩm hàng loạt từ file CSV/XLSX, cập nhật sản phẩm đã có theo SKU"""
+    try:
+        # Đọc file và ghi database trong thread riêng, không chặn event loop
+        result = await run_in_threadpool(import_file, file.file, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Các lô đã ghi vẫn được giữ khi có lỗi
+        clear_product_cache()
+    return {"success": True, **result}
+
+class StockAdjustment(BaseModel):
+    """Một dòng điều chỉnh tồn kho: delta dương là nhập, âm là xuất"""
+    sku: str = Field(..., min_length=1, max_length=100)
+    delta: int = Field(..., ge=-STOCK_ADJUST_MAX_DELTA, le=STOCK_ADJUST_MAX_DELTA)
+
+    @field_validator("delta")
+    @classmethod
+    def delta_not_zero(cls, value: int) -> int:
+        if value == 0:
+            raise ValueError("delta phải khác 0")
+        return value
+
+@router.post("/stock/adjust")
+async def adjust_stock_levels(adjustments: List[StockAdjustment], db: AsyncSession = Depends(get_async_db)):
+    """Điều chỉnh tồn kho hàng loạt theo SKU, cả lô được áp dụng trong một transaction hoặc bị từ chối"""
+    try:
+        items = await db.run_sync(adjust_stock, [(item.sku, item.delta) for item in adjustments], "admin")
+    except StockAdjustmentError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    await db.commit()
+    invalidate_product(*(item["product_id"] for item in items))
+    return {"success": True, "items": items}
+
 @router.get("/{product_id}/edit", response_class=HTMLResponse)
-async def edit_product_form(product_id: int, db: Session = Depends(get_db)):
+async def edit_product_form(request: Request, product_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """Form sửa sản phẩm"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    etag, not_modified = await check_not_modified(request, db, ("products",), TEMPLATE_VERSION)
+    if not_modified:
+        return not_modified
+    
+    product = await db.run_sync(get_product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Sản phẩm không tồn tại")
     
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Sửa sản phẩm</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-4">
-            <h1><i class="fas fa-edit"></i> Sửa sản phẩm</h1>
-            <form action="/products/{product_id}" method="post" enctype="multipart/form-data">
-                <div class="row">
-                    <div class="col-md-6">
-                        <div class="mb-3">
-                            <label class="form-label">Tên sản phẩm *</label>
-                            <input type="text" name="name" class="form-control" value="{product.name}" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Mã SKU *</label>
-                            <input type="text" name="sku" class="form-control" value="{product.sku}" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Giá tiền *</label>
-                            <input type="number" name="price" class="form-control" value="{product.price}" required>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Số lượng trong kho</label>
-                            <input type="number" name="quantity" class="form-control" value="{product.quantity}">
-                        </div>
-                    </div>
-                    <div class="col-md-6">
-                        <div class="mb-3">
-                            <label class="form-label">Danh mục</label>
-                            <input type="text" name="category" class="form-control" value="{product.category or ''}">
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Mô tả</label>
-                            <textarea name="description" class="form-control" rows="3">{product.description or ''}</textarea>
-                        </div>
-                        <div class="mb-3">
-                            <label class="form-label">Ảnh hiện tại</label>
-                            <div class="mb-2">
-                                {''.join([f'<img src="/static/uploads/{img}" class="img-thumbnail me-2" style="max-height: 80px;">' for img in product.images])}
-                            </div>
-                            <input type="file" name="images" class="form-control" multiple accept=".jpg,.jpeg,.png,.webp">
-                        </div>
-                    </div>
-                </div>
-                <div class="mt-3">
-                    <button type="submit" class="btn btn-primary">Cập nhật</button>
-                    <a href="/products" class="btn btn-secondary">Hủy</a>
-                </div>
-            </form>
-        </div>
-    </body>
-    </html>
-    """
+    cacheable = thumbnails_ready(product.images)
+    return render_stream("products/form.html", headers=etag_headers(etag, cacheable), product=product)
 
 @router.post("/{product_id}")
 async def update_product(
@@ -361,17 +346,17 @@ async def update_product(
     quantity: int = Form(0),
     category: str = Form(""),
     description: str = Form(""),
+    reorder_threshold: Optional[int] = Form(None),
     images: List[UploadFile] = File([]),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Cập nhật sản phẩm"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Sản phẩm không tồn tại")
     
-    # Kiểm tra SKU đã tồn tại (trừ sản phẩm hiện tại)
-    existing_product = db.query(Product).filter(Product.sku == sku, Product.id != product_id).first()
-    if existing_product:
+    # Kiểm tra SKU đã tồn tại (trừ sản phẩm hiện tại), trước khi lưu ảnh
+    if sku != product.sku and await _sku_taken(db, sku, product_id):
         raise HTTPException(status_code=400, detail="SKU đã tồn tại")
     
     # Lưu giá trị cũ để log
@@ -381,7 +366,8 @@ async def update_product(
         "price": product.price,
         "quantity": product.quantity,
         "category": product.category,
-        "description": product.description
+        "description": product.description,
+        "reorder_threshold": product.reorder_threshold
     }
     
     # Cập nhật thông tin
@@ -391,128 +377,185 @@ async def update_product(
     product.quantity = quantity
     product.category = category
     product.description = description
+    # Để trống: theo ngưỡng của danh mục (mới) thay vì giữ ngưỡng cũ
+    await db.run_sync(apply_threshold, product, category, reorder_threshold)
     
     # Xử lý upload ảnh mới
+    garbage = []
     if images and any(image.filename for image in images):
-        image_paths = []
-        for image in images[:5]:
-            if image.filename:
-                file_ext = os.path.splitext(image.filename)[1]
-                filename = f"{uuid.uuid4()}{file_ext}"
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                
-                with open(filepath, "wb") as buffer:
-                    shutil.copyfileobj(image.file, buffer)
-                
-                image_paths.append(filename)
+        image_paths = await store_images(images)
         
         # Chỉ cập nhật ảnh nếu có ảnh mới upload
         if image_paths:
+            await db.run_sync(acquire_images, image_paths)
+            garbage = await db.run_sync(release_images, product.images)
             product.images = image_paths
     
-    db.commit()
+    # Log cho từng thay đổi, ghi một lần cùng transaction cập nhật
+    new_values = {field: getattr(product, field) for field in old_values}
+    await db.run_sync(write_product_logs, changed_fields(product.id, old_values, new_values, "admin"))
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if not _is_sku_conflict(e):
+            raise
+        raise HTTPException(status_code=400, detail="SKU đã tồn tại")
+    invalidate_product(product_id)
+    invalidate_card(product_id)
     
-    # Tạo log cho từng thay đổi
-    for field, old_value in old_values.items():
-        new_value = getattr(product, field)
-        if str(old_value) != str(new_value):
-            create_product_log(
-                db, product.id, "update", field, 
-                str(old_value), str(new_value), "admin"
-            )
+    # Xóa file ảnh cũ không còn sản phẩm nào dùng
+    await collect_garbage(garbage)
     
     return RedirectResponse(url="/products?message=Sản phẩm đã được cập nhật thành công!", status_code=303)
 
 @router.delete("/{product_id}")
-async def delete_product(product_id: int, db: Session = Depends(get_db)):
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
     """Xóa sản phẩm"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Sản phẩm không tồn tại")
     
-    # Xóa ảnh
-    for image in product.images:
-        image_path = os.path.join(UPLOAD_DIR, image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    # Tạo log trước khi xóa (cùng transaction)
+    await db.run_sync(write_product_logs, [log_entry(product_id, "delete", changed_by="admin")])
     
-    # Tạo log trước khi xóa
-    create_product_log(db, product_id, "delete", changed_by="admin")
+    # Xóa sản phẩm cùng lịch sử tồn kho, giảm tham chiếu ảnh
+    await db.run_sync(delete_stock_movements, product_id)
+    garbage = await db.run_sync(release_images, product.images)
+    await db.delete(product)
+    await db.commit()
+    invalidate_product(product_id)
+    invalidate_card(product_id)
     
-    # Xóa sản phẩm
-    db.delete(product)
-    db.commit()
+    # Xóa file ảnh không còn sản phẩm nào dùng
+    await collect_garbage(garbage)
     
     return {"success": True, "message": "Sản phẩm đã được xóa thành công"}
 
+@router.get("/logs/retention")
+async def log_retention_stats():
+    """Số liệu dọn log cũ: số log đã xóa và thời gian đã dùng"""
+    return get_retention_stats()
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Số liệu cache (hit/miss) để chọn kích thước cache"""
+    return {"cards": card_cache.stats(), "products": product_cache_stats()}
+
+@router.get("/activity", response_class=HTMLResponse)
+async def activity_feed(request: Request, action: str = "", field: str = "", date_from: str = "",
+                        date_to: str = "", cursor: str = "", db: AsyncSession = Depends(get_async_read_db)):
+    """Hoạt động gần đây của mọi sản phẩm, lọc theo hành động, trường và khoảng ngày"""
+    etag, not_modified = await check_not_modified(request, db, ("products", "product_logs"), TEMPLATE_VERSION)
+    if not_modified:
+        return not_modified
+
+    def load_page(session: Session):
+        logs, next_cursor = log_page(
+            session, action=action, field=field, cursor=cursor,
+            date_from=parse_date(date_from, "Từ ngày"), date_to=parse_date(date_to, "Đến ngày"),
+        )
+        return logs, next_cursor, product_names(session, logs)
+
+    try:
+        logs, next_cursor, names = await db.run_sync(load_page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {k: v for k, v in {"action": action, "field": field, "date_from": date_from, "date_to": date_to}.items() if v}
+    next_url = f"/products/activity?{urlencode({**filters, 'cursor': next_cursor})}" if next_cursor else ""
+    first_url = f"/products/activity?{urlencode(filters)}" if filters else "/products/activity"
+
+    return render_stream(
+        "products/activity.html",
+        headers=etag_headers(etag),
+        logs=logs,
+        names=names,
+        actions=LOG_ACTIONS,
+        fields=LOG_FIELDS,
+        action=action,
+        field=field,
+        date_from=date_from,
+        date_to=date_to,
+        cursor=cursor,
+        next_url=next_url,
+        first_url=first_url,
+    )
+
 @router.get("/{product_id}/logs", response_class=HTMLResponse)
-async def product_logs(product_id: int, db: Session = Depends(get_db)):
-    """Hiển thị lịch sử thay đổi sản phẩm"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def product_logs(request: Request, product_id: int, cursor: str = "",
+                       db: AsyncSession = Depends(get_async_read_db)):
+    """Hiển thị lịch sử thay đổi sản phẩm (phân trang theo cursor)"""
+    etag, not_modified = await check_not_modified(request, db, ("products", "product_logs"), TEMPLATE_VERSION)
+    if not_modified:
+        return not_modified
+    
+    product = await db.run_sync(get_product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Sản phẩm không tồn tại")
     
-    logs = db.query(ProductLog).filter(ProductLog.product_id == product_id).order_by(ProductLog.created_at.desc()).all()
+    try:
+        logs, next_cursor = await db.run_sync(
+            lambda session: log_page(session, product_id=product_id, cursor=cursor)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Lịch sử thay đổi - {product.name}</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body>
-        <div class="container mt-4">
-            <h1><i class="fas fa-history"></i> Lịch sử thay đổi: {product.name}</h1>
-            <a href="/products" class="btn btn-secondary mb-3">← Quay lại</a>
-            
-            <div class="table-responsive">
-                <table class="table table-striped">
-                    <thead>
-                        <tr>
-                            <th>Thời gian</th>
-                            <th>Hành động</th>
-                            <th>Trường thay đổi</th>
-                            <th>Giá trị cũ</th>
-                            <th>Giá trị mới</th>
-                            <th>Người thay đổi</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {''.join([f'''
-                        <tr>
-                            <td>{log.created_at.strftime('%Y-%m-%d %H:%M:%S') if log.created_at else ''}</td>
-                            <td>
-                                <span class="badge bg-{'success' if log.action == 'create' else 'warning' if log.action == 'update' else 'danger'}">
-                                    {log.action}
-                                </span>
-                            </td>
-                            <td>{log.field_name or '-'}</td>
-                            <td>{log.old_value or '-'}</td>
-                            <td>{log.new_value or '-'}</td>
-                            <td>{log.changed_by}</td>
-                        </tr>
-                        ''' for log in logs])}
-                    </tbody>
-                </table>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    next_url = f"/products/{product_id}/logs?{urlencode({'cursor': next_cursor})}" if next_cursor else ""
+    
+    return render_stream(
+        "products/logs.html",
+        headers=etag_headers(etag),
+        product=product,
+        logs=logs,
+        cursor=cursor,
+        next_url=next_url,
+        first_url=f"/products/{product_id}/logs",
+    )
 
 @router.get("/export")
-async def export_excel(db: Session = Depends(get_db)):
+async def export_excel():
     """Xuất dữ liệu ra file Excel"""
-    # Dọn dẹp log cũ
-    cleanup_old_logs(db)
-    
-    # Lấy dữ liệu
-    products = db.query(Product).all()
-    logs = db.query(ProductLog).all()
-    
-    # Xuất Excel
+    # Stream file Excel về client theo từng chunk, không lưu file tạm
     filename = f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = export_products_to_excel(products, logs, filename)
+    return StreamingResponse(
+        stream_products_excel(),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def export_job_response(job: dict):
+    """Thông tin job trả về cho client"""
+    return {
+        **job,
+        "progress": job_progress(job),
+        "download_url": f"/products/export/jobs/{job['id']}/download" if job["status"] == "done" else None,
+    }
+
+@router.post("/export/jobs", status_code=202)
+async def create_export_job(db: AsyncSession = Depends(get_async_read_db)):
+    """Tạo job xuất Excel chạy nền, trả về job id để theo dõi tiến độ"""
+    job = await db.run_sync(submit_export_job)
+    return export_job_response(job)
+
+@router.get("/export/jobs/{job_id}")
+async def export_job_status(job_id: str):
+    """Trạng thái và tiến độ của job xuất Excel"""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    return export_job_response(job)
+
+@router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """Tải file Excel của job đã hoàn thành"""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job không tồn tại")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="Job chưa hoàn thành")
     
-    return FileResponse(filepath, filename=filename) 
\ No newline at end of file
+    filepath = job_filepath(job)
+    if not filepath:
+        raise HTTPException(status_code=410, detail="File xuất đã bị xóa, vui lòng xuất lại")
+    return FileResponse(filepath, filename=job["filename"], media_type=XLSX_MEDIA_TYPE)
@@ -0,0 +1,135 @@
+from datetime import datetime
+import os
+import queue
+import threading
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import ProductLog
+
+# "sync": ghi log cùng transaction với thay đổi sản phẩm
+# "write_behind": đưa vào hàng đợi, thread nền ghi theo lô
+AUDIT_LOG_MODE = os.getenv("AUDIT_LOG_MODE", "sync")
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+_wakeup = threading.Event()
+
+# Log write_behind của một session, chỉ đưa vào hàng đợi khi session commit thành công
+_PENDING_KEY = "pending_audit_logs"
+
+
+def log_entry(product_id: int, action: str, field_name: str = None,
+              old_value: str = None, new_value: str = None, changed_by: str = "admin"):
+    """Tạo một dòng log (dict) để ghi hàng loạt"""
+    return {
+        "product_id": product_id,
+        "action": action,
+        "field_name": field_name,
+        "old_value": old_value,
+        "new_value": new_value,
+        "changed_by": changed_by,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def changed_fields(product_id: int, old_values: dict, new_values: dict, changed_by: str = "admin"):
+    """So sánh giá trị cũ/mới, trả về các dòng log "update" cho trường bị thay đổi"""
+    return [
+        log_entry(product_id, "update", field, str(old_value), str(new_values[field]), changed_by)
+        for field, old_value in old_values.items()
+        if str(old_value) != str(new_values[field])
+    ]
+
+
+def _insert_logs(db, entries):
+    if entries:
+        db.execute(insert(ProductLog), entries)
+
+
+def write_product_logs(db, entries):
+    """Ghi các dòng log bằng một câu INSERT hàng loạt
+
+    Chế độ sync: ghi vào session hiện tại, commit cùng thay đổi sản phẩm.
+    Chế độ write_behind: giữ trong session, sau khi commit mới đưa vào hàng đợi
+    để thread nền ghi theo lô (rollback thì bỏ).
+    """
+    if not entries:
+        return
+    if AUDIT_LOG_MODE == "write_behind":
+        db.info.setdefault(_PENDING_KEY, []).extend(entries)
+        return
+    _insert_logs(db, entries)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed(session):
+    entries = session.info.pop(_PENDING_KEY, None)
+    if not entries:
+        return
+    _ensure_writer()
+    for entry in entries:
+        _queue.put(entry)
+    if _queue.qsize() >= AUDIT_BATCH_SIZE:
+        _wakeup.set()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted(session, transaction):
+    # Transaction kết thúc mà không commit (rollback, close): bỏ log đang giữ
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def _drain(limit: int):
+    batch = []
+    while len(batch) < limit:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def flush_audit_logs():
+    """Ghi toàn bộ log đang chờ trong hàng đợi, trả về số dòng đã ghi"""
+    written = 0
+    while True:
+        batch = _drain(AUDIT_BATCH_SIZE)
+        if not batch:
+            return written
+        db = SessionLocal()
+        try:
+            _insert_logs(db, batch)
+            db.commit()
+            written += len(batch)
+        except Exception as e:
+            db.rollback()
+            # Đưa lại vào hàng đợi để thử lại ở lần sau
+            for entry in batch:
+                _queue.put(entry)
+            print(f"❌ Lỗi khi ghi log: {e}")
+            return written
+        finally:
+            db.close()
+
+
+def _writer_loop():
+    while True:
+        # Ghi theo chu kỳ, hoặc sớm hơn khi hàng đợi đủ một lô
+        _wakeup.wait(AUDIT_FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush_audit_logs()
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name="audit-log-writer", daemon=True)
+            _writer.start()
@@ -0,0 +1,97 @@
+from sqlalchemy import text
+
+from app.models import CategoryStat
+
+_KEY = "coalesce({0}.category, '')"
+_QTY = "coalesce({0}.quantity, 0)"
+_THRESHOLD = "{0}.reorder_threshold"
+
+# Không dùng INSERT OR IGNORE: khi trigger chạy từ câu UPSERT (ON CONFLICT DO UPDATE),
+# SQLite áp dụng cách xử lý xung đột của câu ngoài và báo lỗi UNIQUE
+_ADD = """
+    INSERT INTO category_stats(category, product_count, total_quantity, low_stock_count)
+    SELECT {key}, 0, 0, 0
+    WHERE NOT EXISTS (SELECT 1 FROM category_stats WHERE category = {key});
+    UPDATE category_stats
+    SET product_count = product_count + 1,
+        total_quantity = total_quantity + {qty},
+        low_stock_count = low_stock_count + ({qty} < {threshold})
+    WHERE category = {key};
+"""
+
+_REMOVE = """
+    UPDATE category_stats
+    SET product_count = product_count - 1,
+        total_quantity = total_quantity - {qty},
+        low_stock_count = low_stock_count - ({qty} < {threshold})
+    WHERE category = {key};
+    DELETE FROM category_stats
+    WHERE category = {key} AND product_count <= 0 AND reorder_threshold IS NULL;
+"""
+
+
+def _add(row: str) -> str:
+    return _ADD.format(key=_KEY.format(row), qty=_QTY.format(row), threshold=_THRESHOLD.format(row))
+
+
+def _remove(row: str) -> str:
+    return _REMOVE.format(key=_KEY.format(row), qty=_QTY.format(row), threshold=_THRESHOLD.format(row))
+
+
+# Trigger chỉ được tạo lại khi schema fingerprint đổi (init_db bỏ qua setup nếu
+# PRAGMA user_version khớp): sửa trigger ở đây thì phải tăng SCHEMA_VERSION
+_TRIGGERS = {
+    "category_stats_ai": f"AFTER INSERT ON products BEGIN {_add('new')} END",
+    "category_stats_ad": f"AFTER DELETE ON products BEGIN {_remove('old')} END",
+    "category_stats_au": f"AFTER UPDATE OF category, quantity, reorder_threshold ON products BEGIN {_remove('old')} {_add('new')} END",
+}
+
+
+def setup_category_stats(engine):
+    """Tạo trigger cập nhật category_stats, dựng lại số liệu nếu bảng còn trống"""
+    with engine.begin() as conn:
+        for name, body in _TRIGGERS.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(f"CREATE TRIGGER {name} {body}"))
+
+        empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM category_stats)")).scalar()
+        has_products = conn.execute(text("SELECT EXISTS (SELECT 1 FROM products)")).scalar()
+        if empty and has_products:
+            rebuild_category_stats(conn)
+
+
+def rebuild_category_stats(conn):
+    """Tính lại toàn bộ category_stats từ bảng products"""
+    conn.execute(text("""
+        UPDATE category_stats SET product_count = 0, total_quantity = 0, low_stock_count = 0
+    """))
+    conn.execute(text("""
+        INSERT INTO category_stats(category, product_count, total_quantity, low_stock_count)
+        SELECT coalesce(category, ''), count(*), sum(coalesce(quantity, 0)),
+               sum(coalesce(quantity, 0) < reorder_threshold)
+        FROM products
+        WHERE true
+        GROUP BY coalesce(category, '')
+        ON CONFLICT(category) DO UPDATE SET
+            product_count = excluded.product_count,
+            total_quantity = excluded.total_quantity,
+            low_stock_count = excluded.low_stock_count
+    """))
+    conn.execute(text("""
+        DELETE FROM category_stats WHERE product_count = 0 AND reorder_threshold IS NULL
+    """))
+
+
+def get_category_stats(db):
+    """Danh sách thống kê theo danh mục, O(số danh mục)"""
+    return db.query(CategoryStat).order_by(CategoryStat.category).all()
+
+
+def summarize(stats, category: str = ""):
+    """Tổng số sản phẩm và số sản phẩm sắp hết hàng (toàn bộ hoặc theo danh mục)"""
+    if category:
+        stats = [stat for stat in stats if stat.category == category]
+    return (
+        sum(stat.product_count for stat in stats),
+        sum(stat.low_stock_count for stat in stats),
+    )
@@ -0,0 +1,47 @@
+import secrets
+
+from sqlalchemy import text
+
+from app.models import DataVersion
+
+# Các bảng được theo dõi phiên bản dữ liệu
+VERSIONED_TABLES = ("products", "product_logs")
+
+# Dòng chứa id ngẫu nhiên của database, tạo mới khi database được tạo lại (init_db.py --reset)
+# để khóa cache (ETag, file export) không trùng với database cũ khi bộ đếm bắt đầu lại từ 0
+DATABASE_ID = "database_id"
+
+
+def _version_triggers(table: str):
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+        END
+        """
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def setup_data_versions(engine):
+    """Tạo id database, dòng đếm và trigger tăng phiên bản cho từng bảng được theo dõi"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT OR IGNORE INTO data_versions(name, version) VALUES (:name, :version)"),
+            {"name": DATABASE_ID, "version": secrets.randbits(31) + 1},
+        )
+        for table in VERSIONED_TABLES:
+            conn.execute(
+                text("INSERT OR IGNORE INTO data_versions(name, version) VALUES (:name, 0)"),
+                {"name": table},
+            )
+            for statement in _version_triggers(table):
+                conn.execute(text(statement))
+
+
+def get_data_versions(db) -> dict:
+    """Đọc phiên bản hiện tại của các bảng (không quét bảng dữ liệu)"""
+    rows = db.query(DataVersion.name, DataVersion.version).all()
+    versions = {name: 0 for name in (DATABASE_ID, *VERSIONED_TABLES)}
+    versions.update({name: version for name, version in rows})
+    return versions
@@ -0,0 +1,54 @@
+import hashlib
+
+from fastapi import Request, Response
+
+from app.utils.data_version import DATABASE_ID, get_data_versions
+
+# Trình duyệt luôn hỏi lại server (If-None-Match) trước khi dùng bản đã cache
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag từ các thành phần (phiên bản dữ liệu, tham số truy vấn, ...)"""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """So khớp header If-None-Match (so sánh yếu theo RFC 9110, chấp nhận danh sách và *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+async def check_not_modified(request: Request, db, tables, *parts):
+    """
+    Tính ETag từ phiên bản các bảng `tables` + đường dẫn + tham số truy vấn
+
+    Chỉ đọc bảng data_versions (không truy vấn products). Trả về (etag, response):
+    response là 304 nếu client đã có bản mới nhất, ngược lại là None.
+    """
+    # Đọc phiên bản trước khi truy vấn trang (không cùng transaction): có ghi xen giữa thì
+    # ETag cũ hơn nội dung, lần sau client chỉ nhận lại 200 chứ không giữ nội dung cũ
+    versions = await db.run_sync(get_data_versions)
+    query = sorted(request.query_params.multi_items())
+    etag = make_etag(
+        request.url.path, query, versions[DATABASE_ID], *(versions[table] for table in tables), *parts
+    )
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return etag, Response(status_code=304, headers=etag_headers(etag))
+    return etag, None
+
+
+def etag_headers(etag: str, cacheable: bool = True) -> dict:
+    """Header gửi kèm response có ETag
+
+    cacheable=False: nội dung còn phụ thuộc thứ không có trong ETag (vd. ảnh chưa có
+    thumbnail), không gửi ETag để lần sau trình duyệt nhận bản mới thay vì 304.
+    """
+    if not cacheable:
+        return {"Cache-Control": CACHE_CONTROL}
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
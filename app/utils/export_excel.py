@@ -1,84 +1,312 @@
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from datetime import datetime
+from itertools import islice
+import io
+import math
 import os
+import queue
+import re
+import tempfile
+import threading
+from xml.sax.saxutils import escape
+import zipfile
 
-def export_products_to_excel(products, logs, filename="products_export.xlsx"):
+from app.database import ReadSessionLocal
+from app.models import Product, ProductLog
+
+# Số dòng lấy từ database mỗi lần (yield_per)
+EXPORT_BATCH_SIZE = 1000
+
+# Kích thước mỗi chunk gửi về client khi stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_SHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+# Ký tự điều khiển không được phép trong XML
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Style 1: tiêu đề cột (chữ đậm, nền xám, căn giữa)
+_HEADER_STYLE = 1
+_STYLES = (
+    f'{_XML_DECLARATION}<styleSheet xmlns="{_MAIN_NS}">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="3"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFCCCCCC"/><bgColor rgb="FFCCCCCC"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+    '<alignment horizontal="center"/></xf></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+PRODUCT_HEADERS = ["ID", "Tên sản phẩm", "SKU", "Giá", "Số lượng", "Danh mục", "Mô tả", "Ảnh", "Ngày tạo", "Ngày cập nhật"]
+LOG_HEADERS = ["ID", "ID Sản phẩm", "Hành động", "Trường thay đổi", "Giá trị cũ", "Giá trị mới", "Người thay đổi", "Thời gian"]
+
+PRODUCT_COLUMNS = [
+    Product.id, Product.name, Product.sku, Product.price, Product.quantity,
+    Product.category, Product.description, Product.images, Product.created_at, Product.updated_at,
+]
+LOG_COLUMNS = [
+    ProductLog.id, ProductLog.product_id, ProductLog.action, ProductLog.field_name,
+    ProductLog.old_value, ProductLog.new_value, ProductLog.changed_by, ProductLog.created_at,
+]
+
+
+def _format_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def _product_values(row):
+    """Chuyển một dòng sản phẩm thành danh sách giá trị ô"""
+    return [
+        row.id, row.name, row.sku, row.price, row.quantity, row.category, row.description,
+        ", ".join(row.images) if row.images else "",
+        _format_datetime(row.created_at), _format_datetime(row.updated_at),
+    ]
+
+
+def _log_values(row):
+    """Chuyển một dòng log thành danh sách giá trị ô"""
+    return [
+        row.id, row.product_id, row.action, row.field_name, row.old_value,
+        row.new_value, row.changed_by, _format_datetime(row.created_at),
+    ]
+
+
+def _column_letter(index: int) -> str:
+    """Chữ cái của cột (1 -> A, 27 -> AA)"""
+    letters = ""
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell_xml(ref: str, value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub("", str(value)))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row_xml(row_number: int, columns, values, style: int = 0) -> str:
+    cells = "".join(
+        _cell_xml(f"{column}{row_number}", value, style)
+        for column, value in zip(columns, values) if value is not None and value != ""
+    )
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+def _write_sheet(out, headers, rows, to_values, batch_size, progress=None):
+    """Ghi XML của một sheet vào out (entry trong zip) theo từng batch
+
+    Độ rộng cột được tính trong lúc đọc batch đầu tiên, vì định dạng xlsx
+    yêu cầu thông tin cột nằm trước dữ liệu nên phải đặt trước khi ghi dòng đầu.
     """
-    Xuất danh sách sản phẩm và log ra file Excel
-    
+    columns = [_column_letter(i) for i in range(1, len(headers) + 1)]
+    widths = [len(header) for header in headers]
+    first_batch = []
+    for row in islice(rows, batch_size):
+        values = to_values(row)
+        for i, value in enumerate(values):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+        first_batch.append(values)
+
+    cols = "".join(
+        f'<col min="{i}" max="{i}" width="{min(width + 2, 50)}" customWidth="1"/>'
+        for i, width in enumerate(widths, 1)
+    )
+    parts = [
+        _XML_DECLARATION,
+        f'<worksheet xmlns="{_MAIN_NS}"><cols>{cols}</cols><sheetData>',
+        _row_xml(1, columns, headers, _HEADER_STYLE),
+    ]
+    row_number = 1
+    for values in first_batch:
+        row_number += 1
+        parts.append(_row_xml(row_number, columns, values))
+    out.write("".join(parts).encode("utf-8"))
+    if progress:
+        progress(len(first_batch))
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        parts = []
+        for row in batch:
+            row_number += 1
+            parts.append(_row_xml(row_number, columns, to_values(row)))
+        out.write("".join(parts).encode("utf-8"))
+        if progress:
+            progress(len(batch))
+
+    out.write(b"</sheetData></worksheet>")
+
+
+def write_products_workbook(db, fileobj, batch_size: int = EXPORT_BATCH_SIZE, progress=None):
+    """
+    Ghi sản phẩm và log ra file Excel (fileobj) theo từng batch
+
+    XML của sheet được nén thẳng vào zip trong lúc đọc yield_per nên bộ nhớ
+    không tăng theo số dòng và dữ liệu đến fileobj ngay khi có (fileobj không
+    cần seek được). progress(n) được gọi sau mỗi batch với số dòng vừa ghi.
+    """
+    sheets = [("Sản phẩm", PRODUCT_HEADERS), ("Lịch sử thay đổi", LOG_HEADERS)]
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _workbook_parts(sheets).items():
+            zf.writestr(name, content)
+
+        # Sheet 1: Danh sách sản phẩm
+        products = iter(db.query(*PRODUCT_COLUMNS).order_by(Product.id).yield_per(batch_size))
+        with zf.open("xl/worksheets/sheet1.xml", "w") as out:
+            _write_sheet(out, PRODUCT_HEADERS, products, _product_values, batch_size, progress)
+
+        # Sheet 2: Lịch sử thay đổi
+        logs = iter(db.query(*LOG_COLUMNS).order_by(ProductLog.id).yield_per(batch_size))
+        with zf.open("xl/worksheets/sheet2.xml", "w") as out:
+            _write_sheet(out, LOG_HEADERS, logs, _log_values, batch_size, progress)
+
+
+def _workbook_parts(sheets) -> dict:
+    """Các phần cố định của file xlsx (workbook, style, quan hệ giữa các phần)"""
+    sheet_types = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{_SHEET_TYPE}"/>'
+        for i in range(1, len(sheets) + 1)
+    )
+    sheet_entries = "".join(
+        f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, (name, _) in enumerate(sheets, 1)
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(sheets) + 1)
+    )
+    styles_id = len(sheets) + 1
+    return {
+        "[Content_Types].xml": (
+            f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{sheet_types}</Types>'
+        ),
+        "_rels/.rels": (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_PACKAGE_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ),
+        "xl/workbook.xml": (
+            f'{_XML_DECLARATION}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+            f'<sheets>{sheet_entries}</sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_PACKAGE_REL_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{styles_id}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ),
+        "xl/styles.xml": _STYLES,
+    }
+
+
+def export_products_to_excel(db, filename="products_export.xlsx", progress=None):
+    """
+    Xuất danh sách sản phẩm và log ra file Excel trong thư mục exports/
+
     Args:
-        products: Danh sách sản phẩm
-        logs: Danh sách log thay đổi
+        db: Database session
         filename: Tên file Excel
+        progress: Hàm nhận số dòng vừa ghi (tùy chọn)
     """
-    wb = Workbook()
-    
-    # Sheet 1: Danh sách sản phẩm
-    ws_products = wb.active
-    ws_products.title = "Sản phẩm"
-    
-    # Header cho sheet sản phẩm
-    headers = ["ID", "Tên sản phẩm", "SKU", "Giá", "Số lượng", "Danh mục", "Mô tả", "Ảnh", "Ngày tạo", "Ngày cập nhật"]
-    for col, header in enumerate(headers, 1):
-        cell = ws_products.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Dữ liệu sản phẩm
-    for row, product in enumerate(products, 2):
-        ws_products.cell(row=row, column=1, value=product.id)
-        ws_products.cell(row=row, column=2, value=product.name)
-        ws_products.cell(row=row, column=3, value=product.sku)
-        ws_products.cell(row=row, column=4, value=product.price)
-        ws_products.cell(row=row, column=5, value=product.quantity)
-        ws_products.cell(row=row, column=6, value=product.category)
-        ws_products.cell(row=row, column=7, value=product.description)
-        ws_products.cell(row=row, column=8, value=", ".join(product.images) if product.images else "")
-        ws_products.cell(row=row, column=9, value=product.created_at.strftime("%Y-%m-%d %H:%M:%S") if product.created_at else "")
-        ws_products.cell(row=row, column=10, value=product.updated_at.strftime("%Y-%m-%d %H:%M:%S") if product.updated_at else "")
-    
-    # Sheet 2: Lịch sử thay đổi
-    ws_logs = wb.create_sheet("Lịch sử thay đổi")
-    
-    # Header cho sheet log
-    log_headers = ["ID", "ID Sản phẩm", "Hành động", "Trường thay đổi", "Giá trị cũ", "Giá trị mới", "Người thay đổi", "Thời gian"]
-    for col, header in enumerate(log_headers, 1):
-        cell = ws_logs.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Dữ liệu log
-    for row, log in enumerate(logs, 2):
-        ws_logs.cell(row=row, column=1, value=log.id)
-        ws_logs.cell(row=row, column=2, value=log.product_id)
-        ws_logs.cell(row=row, column=3, value=log.action)
-        ws_logs.cell(row=row, column=4, value=log.field_name)
-        ws_logs.cell(row=row, column=5, value=log.old_value)
-        ws_logs.cell(row=row, column=6, value=log.new_value)
-        ws_logs.cell(row=row, column=7, value=log.changed_by)
-        ws_logs.cell(row=row, column=8, value=log.created_at.strftime("%Y-%m-%d %H:%M:%S") if log.created_at else "")
-    
-    # Điều chỉnh độ rộng cột
-    for ws in [ws_products, ws_logs]:
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Lưu file
     export_dir = "exports"
     os.makedirs(export_dir, exist_ok=True)
     filepath = os.path.join(export_dir, filename)
-    wb.save(filepath)
-    
-    return filepath 
\ No newline at end of file
+
+    # Ghi ra file tạm (tên riêng cho mỗi lần xuất, các worker xuất cùng phiên bản
+    # không ghi đè nhau) rồi đổi tên để không ai đọc được file ghi dở
+    fd, partial = tempfile.mkstemp(dir=export_dir, prefix=f"{filename}.", suffix=".partial")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_products_workbook(db, f, progress=progress)
+        os.replace(partial, filepath)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return filepath
+
+
+class _QueueWriter(io.RawIOBase):
+    """File-like chỉ ghi, đẩy dữ liệu vào queue để stream về client"""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        chunk = bytes(data)
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("Client đã ngắt kết nối")
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return len(chunk)
+            except queue.Full:
+                continue
+
+
+def stream_products_excel(batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Generator trả về file Excel theo từng chunk, không tạo file trong exports/
+
+    Workbook được ghi ở thread riêng với session riêng, mỗi chunk được gửi
+    ngay khi nén xong; queue có giới hạn nên bộ nhớ tối đa chỉ vài chunk dù
+    dữ liệu lớn đến đâu.
+    """
+    chunks = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+    done = object()
+    errors = []
+
+    def worker():
+        db = ReadSessionLocal()
+        try:
+            with io.BufferedWriter(_QueueWriter(chunks, cancelled), buffer_size=STREAM_CHUNK_SIZE) as out:
+                write_products_workbook(db, out, batch_size)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+            if not cancelled.is_set():
+                chunks.put(done)
+
+    thread = threading.Thread(target=worker, name="excel-export", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        # Client ngắt kết nối giữa chừng: dừng thread ghi
+        cancelled.set()
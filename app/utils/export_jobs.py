@@ -0,0 +1,206 @@
+"""
+Hàng đợi xuất Excel chạy nền
+
+Trạng thái job được lưu thành file JSON trong exports/jobs/ để mọi worker
+uvicorn đều đọc được. File Excel đã xuất được cache theo phiên bản dữ liệu
+(data_versions): nếu sản phẩm và log chưa thay đổi thì trả về ngay file cũ.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import time
+import uuid
+
+from sqlalchemy import func
+
+from app.database import ReadSessionLocal
+from app.models import Product, ProductLog
+from app.utils.data_version import DATABASE_ID, get_data_versions
+from app.utils.export_excel import export_products_to_excel
+
+EXPORT_DIR = "exports"
+JOBS_DIR = os.path.join(EXPORT_DIR, "jobs")
+
+# Dung lượng tối đa của các file Excel được cache (mặc định 500MB)
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Thời gian giữ file trạng thái job
+JOB_TTL = timedelta(days=1)
+
+# Chỉ chạy 1 export cùng lúc để không tranh tài nguyên với request
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-job")
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _cache_filename(versions: dict) -> str:
+    return (
+        f"products_export_{versions[DATABASE_ID]}"
+        f"_v{versions['products']}_{versions['product_logs']}.xlsx"
+    )
+
+
+def _save_job(job: dict):
+    """Ghi trạng thái job (ghi file tạm rồi đổi tên để không đọc phải file dở)"""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _job_path(job["id"])
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def get_job(job_id: str):
+    """Đọc trạng thái job, trả về None nếu không tồn tại"""
+    # job_id do hệ thống sinh (uuid hex), chặn path traversal
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_job_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _cached_export(filename: str):
+    """Trả về đường dẫn file cache nếu có, đồng thời đánh dấu vừa được dùng (LRU)"""
+    filepath = os.path.join(EXPORT_DIR, filename)
+    if not os.path.exists(filepath):
+        return None
+    os.utime(filepath)
+    return filepath
+
+
+def evict_exports(max_bytes: int = EXPORT_CACHE_MAX_BYTES, keep=()):
+    """Xóa các file Excel ít được dùng nhất cho đến khi tổng dung lượng <= max_bytes"""
+    if not os.path.isdir(EXPORT_DIR):
+        return []
+
+    files = []
+    for entry in os.scandir(EXPORT_DIR):
+        if entry.is_file() and entry.name.endswith(".xlsx"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    removed = []
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+
+    # Dọn file trạng thái job quá hạn
+    if os.path.isdir(JOBS_DIR):
+        expire_before = time.time() - JOB_TTL.total_seconds()
+        for entry in os.scandir(JOBS_DIR):
+            if entry.is_file() and entry.stat().st_mtime < expire_before:
+                os.remove(entry.path)
+
+    return removed
+
+
+def _run_job(job: dict):
+    """Thực thi job xuất Excel trong thread nền"""
+    db = ReadSessionLocal()
+    try:
+        job["status"] = "running"
+        job["started_at"] = datetime.utcnow().isoformat()
+        _save_job(job)
+
+        # Job khác có thể đã xuất xong cùng phiên bản dữ liệu, kiểm tra cache lại
+        versions = get_data_versions(db)
+        filename = _cache_filename(versions)
+        filepath = _cached_export(filename)
+
+        if filepath is None:
+            job["rows_total"] = (
+                db.query(func.count(Product.id)).scalar() +
+                db.query(func.count(ProductLog.id)).scalar()
+            )
+            _save_job(job)
+
+            last_saved = time.monotonic()
+
+            def progress(rows: int):
+                nonlocal last_saved
+                job["rows_done"] += rows
+                # Giới hạn tần suất ghi file trạng thái
+                if time.monotonic() - last_saved >= 0.5:
+                    _save_job(job)
+                    last_saved = time.monotonic()
+
+            filepath = export_products_to_excel(db, filename, progress=progress)
+            evict_exports(keep=(filepath,))
+        else:
+            job["cached"] = True
+
+        job.update(
+            status="done",
+            filename=filename,
+            rows_done=job["rows_total"],
+            finished_at=datetime.utcnow().isoformat(),
+        )
+    except Exception as e:
+        job.update(status="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+    finally:
+        db.close()
+        _save_job(job)
+
+
+def submit_export_job(db) -> dict:
+    """
+    Tạo job xuất Excel
+
+    Nếu đã có file xuất ứng với phiên bản dữ liệu hiện tại thì job hoàn thành ngay.
+    """
+    versions = get_data_versions(db)
+    filename = _cache_filename(versions)
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "pending",
+        "cached": False,
+        "versions": versions,
+        "filename": None,
+        "rows_done": 0,
+        "rows_total": 0,
+        "error": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+    if _cached_export(filename):
+        job.update(status="done", cached=True, filename=filename, finished_at=job["created_at"])
+        _save_job(job)
+        return job
+
+    _save_job(job)
+    _executor.submit(_run_job, dict(job))
+    return job
+
+
+def job_progress(job: dict) -> float:
+    """Tiến độ job từ 0 đến 1"""
+    if job["status"] == "done":
+        return 1.0
+    if not job["rows_total"]:
+        return 0.0
+    return min(job["rows_done"] / job["rows_total"], 1.0)
+
+
+def job_filepath(job: dict):
+    """Đường dẫn file kết quả của job (None nếu chưa xong hoặc đã bị xóa khỏi cache)"""
+    if job["status"] != "done" or not job["filename"]:
+        return None
+    return _cached_export(job["filename"])
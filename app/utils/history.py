@@ -0,0 +1,59 @@
+from datetime import date, datetime, time, timedelta
+
+from app.models import Product, ProductLog
+from app.utils.pagination import keyset_page
+
+# Số log mỗi trang lịch sử
+LOG_PAGE_SIZE = 50
+
+LOG_ACTIONS = ("create", "update", "delete")
+LOG_FIELDS = ("name", "sku", "price", "quantity", "category", "description", "reorder_threshold")
+
+# Mới nhất trước; id để thứ tự ổn định khi trùng created_at
+LOG_KEYS = [(ProductLog.created_at, True), (ProductLog.id, True)]
+
+
+def parse_date(value: str, field: str):
+    """Ngày dạng YYYY-MM-DD (từ input type=date), rỗng = không lọc"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} không hợp lệ: {value}")
+
+
+def log_page(db, product_id: int = None, action: str = "", field: str = "",
+             date_from: date = None, date_to: date = None, cursor: str = "", limit: int = LOG_PAGE_SIZE):
+    """
+    Một trang log (mới nhất trước) theo keyset pagination
+
+    Mỗi điều kiện lọc đều có index (product_id|action|field_name, created_at),
+    lọc theo ngày dùng ix_product_logs_created_at. Raise ValueError nếu cursor
+    hoặc bộ lọc không hợp lệ.
+    """
+    if action and action not in LOG_ACTIONS:
+        raise ValueError(f"Hành động không hợp lệ: {action}")
+
+    query = db.query(ProductLog)
+    if product_id is not None:
+        query = query.filter(ProductLog.product_id == product_id)
+    if action:
+        query = query.filter(ProductLog.action == action)
+    if field:
+        query = query.filter(ProductLog.field_name == field)
+    if date_from:
+        query = query.filter(ProductLog.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        # Tính cả ngày date_to
+        query = query.filter(ProductLog.created_at < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    return keyset_page(query, LOG_KEYS, lambda log: (log.created_at, log.id), cursor, limit)
+
+
+def product_names(db, logs) -> dict:
+    """Tên sản phẩm cho các log trong trang (một truy vấn cho cả trang)"""
+    ids = {log.product_id for log in logs}
+    if not ids:
+        return {}
+    return dict(db.query(Product.id, Product.name).filter(Product.id.in_(ids)).all())
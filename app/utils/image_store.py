@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+
+from sqlalchemy import bindparam, delete, text, update
+from sqlalchemy.dialects.sqlite import insert
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.models import ImageRef
+from app.utils.thumbnails import remove_thumbnails
+from app.utils.uploads import UPLOAD_DIR
+
+# Không dọn file mới upload hoặc vừa được dùng lại trong khoảng này (request có thể chưa commit)
+ORPHAN_GRACE_SECONDS = 3600
+
+# Chu kỳ dọn file ảnh không còn tham chiếu (giây)
+ORPHAN_GC_INTERVAL = int(os.getenv("ORPHAN_GC_INTERVAL", "3600"))
+
+# Số tên file mỗi câu truy vấn kiểm tra tham chiếu
+_REFERENCE_CHUNK = 500
+
+_PRODUCT_IMAGES = text("""
+    SELECT DISTINCT image.value
+    FROM products, json_each(products.images) AS image
+    WHERE json_valid(products.images) AND image.value IN :filenames
+""").bindparams(bindparam("filenames", expanding=True))
+
+
+def setup_image_refs(engine):
+    """Dựng bảng đếm tham chiếu từ products.images nếu bảng còn trống"""
+    with engine.begin() as conn:
+        empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM image_refs)")).scalar()
+        if empty:
+            rebuild_image_refs(conn)
+
+
+def rebuild_image_refs(conn):
+    """Tính lại số tham chiếu của mọi file ảnh từ bảng products"""
+    conn.execute(text("DELETE FROM image_refs"))
+    conn.execute(text("""
+        INSERT INTO image_refs(filename, ref_count)
+        SELECT image.value, count(DISTINCT products.id)
+        FROM products, json_each(products.images) AS image
+        WHERE json_valid(products.images)
+        GROUP BY image.value
+    """))
+
+
+def acquire_images(db, filenames):
+    """Tăng số tham chiếu cho các ảnh của một sản phẩm (không commit)"""
+    for filename in set(filenames or []):
+        stmt = insert(ImageRef).values(filename=filename, ref_count=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[ImageRef.filename],
+            set_={"ref_count": ImageRef.ref_count + 1},
+        ))
+
+
+def release_images(db, filenames):
+    """Giảm số tham chiếu, trả về các ảnh không còn sản phẩm nào dùng (không commit)"""
+    filenames = list(set(filenames or []))
+    if not filenames:
+        return []
+    db.execute(
+        update(ImageRef)
+        .where(ImageRef.filename.in_(filenames))
+        .values(ref_count=ImageRef.ref_count - 1)
+    )
+    unreferenced = [
+        filename for (filename,) in db.query(ImageRef.filename).filter(
+            ImageRef.filename.in_(filenames), ImageRef.ref_count <= 0
+        )
+    ]
+    if unreferenced:
+        db.execute(delete(ImageRef).where(ImageRef.filename.in_(unreferenced)))
+    return unreferenced
+
+
+def _referenced(db, filenames) -> set:
+    """Các file còn trong image_refs hoặc còn nằm trong products.images"""
+    filenames = list(filenames)
+    referenced = set()
+    for i in range(0, len(filenames), _REFERENCE_CHUNK):
+        chunk = filenames[i:i + _REFERENCE_CHUNK]
+        referenced.update(f for (f,) in db.query(ImageRef.filename).filter(ImageRef.filename.in_(chunk)))
+        referenced.update(f for (f,) in db.execute(_PRODUCT_IMAGES, {"filenames": chunk}))
+    return referenced
+
+
+def remove_unused_images(db, filenames, grace_seconds: int = ORPHAN_GRACE_SECONDS):
+    """
+    Xóa các file ảnh không còn được tham chiếu, trả về các file đã xóa
+
+    Bỏ qua file sửa đổi trong vòng grace_seconds: upload trùng nội dung dùng lại
+    file cũ (chỉ cập nhật mtime) và chưa có tham chiếu cho đến khi request commit.
+    Ngay trước khi xóa từng file, đọc lại image_refs ở transaction mới.
+    """
+    referenced = _referenced(db, filenames)
+    filenames = [filename for filename in filenames if filename not in referenced]
+    expire_before = time.time() - grace_seconds
+    removed = []
+    for filename in filenames:
+        path = os.path.join(UPLOAD_DIR, filename)
+        try:
+            if os.stat(path).st_mtime > expire_before:
+                continue
+            db.rollback()
+            if db.query(ImageRef.filename).filter(ImageRef.filename == filename).first():
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            # Worker khác vừa dọn file này
+            continue
+        removed.append(filename)
+    remove_thumbnails(removed)
+    return removed
+
+
+def _collect(filenames):
+    db = SessionLocal()
+    try:
+        return remove_unused_images(db, filenames)
+    finally:
+        db.close()
+
+
+async def collect_garbage(filenames):
+    """Xóa file của các ảnh đã hết tham chiếu (gọi sau khi commit)
+
+    Kiểm tra lại trong database vì ảnh có thể vừa được request khác dùng lại;
+    file mới dùng trong ORPHAN_GRACE_SECONDS được để lại cho task dọn ảnh.
+    """
+    if not filenames:
+        return []
+    return await run_in_threadpool(_collect, filenames)
+
+
+def gc_orphan_images(db, grace_seconds: int = ORPHAN_GRACE_SECONDS):
+    """Dọn các file trong uploads/ không còn được tham chiếu (ví dụ request lỗi sau khi lưu ảnh)"""
+    referenced = {filename for (filename,) in db.query(ImageRef.filename)}
+    candidates = [
+        entry.name for entry in os.scandir(UPLOAD_DIR)
+        if entry.is_file() and entry.name not in referenced
+    ]
+    return remove_unused_images(db, candidates, grace_seconds)
+
+
+def _gc_once():
+    db = SessionLocal()
+    try:
+        return gc_orphan_images(db)
+    finally:
+        db.close()
+
+
+async def orphan_gc_loop(interval: int = ORPHAN_GC_INTERVAL):
+    """Task nền: dọn file ảnh không còn tham chiếu mỗi `interval` giây (chạy trong threadpool)"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(_gc_once)
+            if removed:
+                print(f"🧹 Đã xóa {len(removed)} file ảnh không còn sử dụng")
+        except Exception as e:
+            print(f"❌ Lỗi khi dọn ảnh: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,311 @@
+"""
+Nhập sản phẩm hàng loạt từ file CSV/XLSX
+
+File được đọc theo kiểu stream (CSV từng dòng, XLSX bằng openpyxl read-only),
+kiểm tra và ghi theo lô: mỗi lô là một transaction gồm một câu
+INSERT ... ON CONFLICT(sku) DO UPDATE và một câu INSERT log hàng loạt.
+Dòng lỗi không làm hỏng cả lô, được báo lại ở cuối kết quả; lô ghi lỗi
+được ghi lại từng dòng để các dòng hợp lệ vẫn được nhập.
+"""
+
+import csv
+from datetime import datetime
+import io
+from itertools import islice
+import math
+import os
+import zipfile
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.database import SessionLocal
+from app.models import Product
+from app.utils.audit_log import changed_fields, log_entry, write_product_logs
+from app.utils.low_stock import resolve_threshold
+
+# Số dòng mỗi lô (mỗi lô một transaction)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Số lỗi tối đa trả về chi tiết (vẫn đếm đủ tất cả)
+IMPORT_MAX_ERRORS = 1000
+
+# Tên cột chấp nhận trong file (không phân biệt hoa thường), gồm cả tiêu đề của file xuất Excel
+COLUMN_ALIASES = {
+    "name": ("name", "tên sản phẩm"),
+    "sku": ("sku", "mã sku"),
+    "price": ("price", "giá", "giá tiền"),
+    "quantity": ("quantity", "số lượng"),
+    "category": ("category", "danh mục"),
+    "description": ("description", "mô tả"),
+    "reorder_threshold": ("reorder_threshold", "ngưỡng cảnh báo", "ngưỡng cảnh báo tồn kho"),
+}
+
+# Các trường được ghi khi upsert (và được so sánh để ghi log)
+IMPORT_FIELDS = ("name", "price", "quantity", "category", "description", "reorder_threshold")
+_UPSERT_FIELDS = IMPORT_FIELDS + ("threshold_override",)
+
+
+class ImportRowError(ValueError):
+    """Lỗi dữ liệu của một dòng trong file nhập"""
+
+
+def _column_map(header) -> dict:
+    """Vị trí cột trong file -> tên trường"""
+    lookup = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for index, title in enumerate(header):
+        field = lookup.get(str(title or "").strip().lower())
+        if field and field not in mapping.values():
+            mapping[index] = field
+    missing = [field for field in ("name", "sku", "price") if field not in mapping.values()]
+    if missing:
+        raise ValueError(f"Thiếu cột bắt buộc: {', '.join(missing)}")
+    return mapping
+
+
+def _rows(header, values_iter):
+    """Sinh (số dòng, dict giá trị) bỏ qua dòng trống, số dòng tính cả dòng tiêu đề"""
+    mapping = _column_map(header)
+    for row_number, values in enumerate(values_iter, start=2):
+        if not any(value not in (None, "") for value in values):
+            continue
+        yield row_number, {field: values[index] if index < len(values) else None
+                           for index, field in mapping.items()}
+
+
+def read_csv(fileobj):
+    """Đọc file CSV (UTF-8, tự nhận dấu phân cách , ; hoặc tab)"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("File rỗng")
+        yield from _rows(header, reader)
+    finally:
+        # Không đóng file gốc (do nơi gọi quản lý)
+        text.detach()
+
+
+def read_xlsx(fileobj):
+    """Đọc sheet đầu tiên của file XLSX ở chế độ read-only (không nạp cả file vào bộ nhớ)"""
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        # Không phải file zip, hoặc zip thiếu phần workbook
+        raise ValueError("File XLSX không hợp lệ") from e
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("File rỗng")
+        yield from _rows(header, rows)
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename: str):
+    """Chọn cách đọc theo phần mở rộng file"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".csv":
+        return read_csv(fileobj)
+    if ext == ".xlsx":
+        return read_xlsx(fileobj)
+    raise ValueError("Chỉ hỗ trợ file CSV hoặc XLSX")
+
+
+def _text(value, field: str, max_length: int = None, required: bool = False) -> str:
+    text = "" if value is None else str(value).strip()
+    if required and not text:
+        raise ImportRowError(f"Thiếu {field}")
+    if max_length and len(text) > max_length:
+        raise ImportRowError(f"{field} dài quá {max_length} ký tự")
+    return text
+
+
+def _number(value, field: str, integer: bool = False, default=None):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if default is None:
+            raise ImportRowError(f"Thiếu {field}")
+        return default
+    try:
+        number = float(str(value).strip().replace(" ", "")) if isinstance(value, str) else float(value)
+    except ValueError:
+        raise ImportRowError(f"{field} không phải số: {value}")
+    if not math.isfinite(number):
+        # nan/inf: float() chấp nhận nhưng không ghi được vào database
+        raise ImportRowError(f"{field} không phải số hợp lệ: {value}")
+    if number < 0:
+        raise ImportRowError(f"{field} không được âm")
+    if integer:
+        if not number.is_integer():
+            raise ImportRowError(f"{field} phải là số nguyên: {value}")
+        return int(number)
+    return number
+
+
+def validate_row(row: dict) -> dict:
+    """Kiểm tra và chuẩn hóa một dòng, lỗi thì raise ImportRowError"""
+    threshold = row.get("reorder_threshold")
+    return {
+        "sku": _text(row.get("sku"), "sku", 100, required=True),
+        "name": _text(row.get("name"), "name", 255, required=True),
+        "price": _number(row.get("price"), "price"),
+        "quantity": _number(row.get("quantity"), "quantity", integer=True, default=0),
+        "category": _text(row.get("category"), "category", 100),
+        "description": _text(row.get("description"), "description"),
+        "reorder_threshold": None if threshold in (None, "") else _number(threshold, "reorder_threshold", integer=True),
+    }
+
+
+def _upsert_statement():
+    stmt = insert(Product)
+    excluded = stmt.excluded
+    columns = Product.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={**{field: excluded[field] for field in _UPSERT_FIELDS}, "updated_at": excluded.updated_at},
+        # Không ghi (và không kích hoạt trigger) nếu dữ liệu không đổi
+        where=or_(*(columns[field].is_distinct_from(excluded[field]) for field in _UPSERT_FIELDS)),
+    )
+
+
+def _write_batch(db, batch, changed_by: str) -> dict:
+    """Upsert một lô dòng hợp lệ và ghi log, trả về số sản phẩm tạo mới/cập nhật/không đổi"""
+    skus = [row["sku"] for _, row in batch]
+    existing = {
+        row.sku: row for row in db.execute(
+            select(Product.id, Product.sku, *(getattr(Product, f) for f in _UPSERT_FIELDS))
+            .where(Product.sku.in_(skus))
+        )
+    }
+
+    now = datetime.utcnow()
+    values = []
+    category_thresholds = {}
+    for _, row in batch:
+        old = existing.get(row["sku"])
+        # Không sửa row: lô lỗi được ghi lại từng dòng với dữ liệu gốc
+        row = {**row, "threshold_override": row["reorder_threshold"] is not None}
+        if row["reorder_threshold"] is None:
+            if old and old.threshold_override:
+                # Không có trong file: giữ ngưỡng riêng đã đặt
+                row["reorder_threshold"] = old.reorder_threshold
+                row["threshold_override"] = True
+            else:
+                # Sản phẩm mới hoặc đang theo danh mục: lấy theo danh mục (có thể vừa đổi)
+                if row["category"] not in category_thresholds:
+                    category_thresholds[row["category"]] = resolve_threshold(db, row["category"])
+                row["reorder_threshold"] = category_thresholds[row["category"]]
+        values.append({**row, "images": [], "created_at": now, "updated_at": now})
+
+    db.execute(_upsert_statement(), values)
+
+    ids = dict(db.execute(select(Product.sku, Product.id).where(Product.sku.in_(skus))).all())
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    logs = []
+    for row in values:
+        product_id = ids[row["sku"]]
+        old = existing.get(row["sku"])
+        if old is None:
+            counts["created"] += 1
+            logs.append(log_entry(product_id, "create", changed_by=changed_by))
+            continue
+        changes = changed_fields(
+            product_id, {f: getattr(old, f) for f in IMPORT_FIELDS}, row, changed_by
+        )
+        counts["updated" if changes else "unchanged"] += 1
+        logs.extend(changes)
+    write_product_logs(db, logs)
+    return counts
+
+
+def _db_error(exc: Exception) -> str:
+    """Thông báo lỗi ngắn cho một dòng (không kèm câu SQL và tham số)"""
+    orig = getattr(exc, "orig", None)
+    return f"Lỗi khi ghi database: {orig or type(exc).__name__}"
+
+
+def _write_rows(db, batch, changed_by: str, add_error) -> dict:
+    """Ghi một lô; lô lỗi thì ghi lại từng dòng để các dòng hợp lệ vẫn được nhập"""
+    try:
+        counts = _write_batch(db, batch, changed_by)
+        db.commit()
+        return counts
+    except Exception as e:
+        db.rollback()
+        if len(batch) == 1:
+            row_number, row = batch[0]
+            add_error(row_number, row["sku"], _db_error(e))
+            return {}
+
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    for item in batch:
+        for key, count in _write_rows(db, [item], changed_by, add_error).items():
+            counts[key] += count
+    return counts
+
+
+def import_products(db, rows, batch_size: int = IMPORT_BATCH_SIZE, changed_by: str = "import") -> dict:
+    """
+    Nhập sản phẩm từ các dòng (số dòng, dict), upsert theo SKU
+
+    Mỗi lô được commit riêng. Trả về số lượng tạo mới/cập nhật/không đổi/lỗi
+    và danh sách lỗi theo dòng.
+    """
+    result = {"total_rows": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+    seen = {}
+
+    def add_error(row_number: int, sku, message: str):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append({"row": row_number, "sku": sku, "error": message})
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        for row_number, raw in chunk:
+            result["total_rows"] += 1
+            try:
+                row = validate_row(raw)
+            except ImportRowError as e:
+                add_error(row_number, raw.get("sku"), str(e))
+                continue
+            if row["sku"] in seen:
+                add_error(row_number, row["sku"], f"SKU bị trùng với dòng {seen[row['sku']]}")
+                continue
+            seen[row["sku"]] = row_number
+            batch.append((row_number, row))
+
+        if not batch:
+            continue
+        counts = _write_rows(db, batch, changed_by, add_error)
+        for key, count in counts.items():
+            result[key] += count
+
+    result["errors_truncated"] = result["failed"] > len(result["errors"])
+    return result
+
+
+def import_file(fileobj, filename: str, batch_size: int = IMPORT_BATCH_SIZE, changed_by: str = "import") -> dict:
+    """Nhập sản phẩm từ file CSV/XLSX với session riêng (chạy trong thread hoặc CLI)"""
+    rows = read_rows(fileobj, filename)
+    db = SessionLocal()
+    try:
+        return import_products(db, rows, batch_size, changed_by)
+    finally:
+        db.close()
@@ -0,0 +1,103 @@
+"""
+Xóa log cũ chạy nền theo lịch
+
+Log được xóa theo từng lô nhỏ (dựa trên index product_logs.created_at), mỗi lô
+một transaction ngắn để không khóa database lâu và không làm chậm request.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+import os
+import threading
+import time
+
+from sqlalchemy import delete, select
+
+from app.database import SessionLocal
+from app.models import ProductLog
+
+# Số ngày giữ log
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "15"))
+# Số log xóa mỗi lô
+LOG_RETENTION_BATCH_SIZE = int(os.getenv("LOG_RETENTION_BATCH_SIZE", "5000"))
+# Chu kỳ chạy (giây), mặc định mỗi giờ
+LOG_RETENTION_INTERVAL = int(os.getenv("LOG_RETENTION_INTERVAL", "3600"))
+
+# Số liệu các lần dọn log
+retention_stats = {
+    "runs": 0,
+    "rows_purged": 0,
+    "seconds_spent": 0.0,
+    "last_run_at": None,
+    "last_rows_purged": 0,
+    "last_seconds": 0.0,
+    "last_error": None,
+}
+_stats_lock = threading.Lock()
+
+
+def purge_old_logs(db, days: int = LOG_RETENTION_DAYS, batch_size: int = LOG_RETENTION_BATCH_SIZE) -> int:
+    """Xóa log cũ hơn `days` ngày theo từng lô, trả về số log đã xóa"""
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    batch = (
+        select(ProductLog.id)
+        .where(ProductLog.created_at < cutoff_date)
+        .order_by(ProductLog.created_at)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    purged = 0
+    while True:
+        deleted = db.execute(delete(ProductLog).where(ProductLog.id.in_(batch))).rowcount
+        db.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+def cleanup_old_logs(db):
+    """Xóa log cũ hơn LOG_RETENTION_DAYS ngày và ghi lại số liệu"""
+    started = time.perf_counter()
+    error = None
+    purged = 0
+    try:
+        purged = purge_old_logs(db)
+    except Exception as e:
+        db.rollback()
+        error = str(e)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        with _stats_lock:
+            retention_stats["runs"] += 1
+            retention_stats["rows_purged"] += purged
+            retention_stats["seconds_spent"] += seconds
+            retention_stats["last_run_at"] = datetime.utcnow().isoformat()
+            retention_stats["last_rows_purged"] = purged
+            retention_stats["last_seconds"] = seconds
+            retention_stats["last_error"] = error
+    return purged
+
+
+def _run_once():
+    db = SessionLocal()
+    try:
+        return cleanup_old_logs(db)
+    finally:
+        db.close()
+
+
+async def retention_loop(interval: int = LOG_RETENTION_INTERVAL):
+    """Task nền: dọn log cũ mỗi `interval` giây (chạy trong threadpool)"""
+    while True:
+        try:
+            await asyncio.to_thread(_run_once)
+        except Exception as e:
+            print(f"❌ Lỗi khi xóa log cũ: {e}")
+        await asyncio.sleep(interval)
+
+
+def get_retention_stats() -> dict:
+    """Số liệu dọn log: tổng số log đã xóa, thời gian đã dùng, lần chạy gần nhất"""
+    with _stats_lock:
+        return dict(retention_stats, retention_days=LOG_RETENTION_DAYS)
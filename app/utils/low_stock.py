@@ -0,0 +1,52 @@
+import os
+
+from app.models import CategoryStat, Product
+
+# Ngưỡng cảnh báo mặc định khi sản phẩm và danh mục chưa cấu hình
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+
+
+def low_stock_condition():
+    """Điều kiện sắp hết hàng, khớp với partial index ix_products_low_stock"""
+    return Product.quantity < Product.reorder_threshold
+
+
+def resolve_threshold(db, category: str, threshold=None) -> int:
+    """Ngưỡng cho sản phẩm: giá trị nhập (ngưỡng riêng) > ngưỡng của danh mục > mặc định"""
+    if threshold is not None:
+        return threshold
+    if category:
+        stat = db.get(CategoryStat, category)
+        if stat and stat.reorder_threshold is not None:
+            return stat.reorder_threshold
+    return LOW_STOCK_THRESHOLD
+
+
+def apply_threshold(db, product, category: str, threshold=None):
+    """Đặt ngưỡng cho sản phẩm khi tạo/sửa (không commit)
+
+    threshold=None: bỏ ngưỡng riêng, lấy theo danh mục hiện tại của sản phẩm (kể cả
+    khi vừa chuyển danh mục). Cột reorder_threshold luôn lưu ngưỡng đang áp dụng
+    để partial index ix_products_low_stock dùng được.
+    """
+    # Không flush thay đổi của sản phẩm khi đọc category_stats (lỗi trùng SKU phải xảy ra lúc commit)
+    with db.no_autoflush:
+        product.reorder_threshold = resolve_threshold(db, category, threshold)
+    product.threshold_override = threshold is not None
+
+
+def set_category_threshold(db, category: str, threshold: int) -> int:
+    """Đặt ngưỡng cho danh mục và áp dụng cho các sản phẩm trong danh mục chưa có ngưỡng riêng
+
+    Trả về số sản phẩm được cập nhật. Không commit.
+    """
+    stat = db.get(CategoryStat, category)
+    if stat is None:
+        stat = CategoryStat(category=category, product_count=0, total_quantity=0, low_stock_count=0)
+        db.add(stat)
+    stat.reorder_threshold = threshold
+    db.flush()
+
+    return db.query(Product).filter(Product.category == category, Product.threshold_override.is_(False)).update(
+        {Product.reorder_threshold: threshold}, synchronize_session=False
+    )
@@ -0,0 +1,249 @@
+"""
+Đo thời gian request và truy vấn SQL, xuất theo định dạng text của Prometheus
+
+- MetricsMiddleware: histogram độ trễ, số câu SQL và tổng thời gian SQL theo route
+- instrument_engine: hook before/after_cursor_execute đếm và đo từng câu SQL,
+  cộng vào request đang xử lý (qua contextvar), ghi log câu chậm hơn SLOW_QUERY_MS
+- render_metrics: nội dung cho endpoint /metrics
+
+Số liệu nằm trong bộ nhớ của từng process (mỗi worker uvicorn có số liệu riêng).
+"""
+
+from bisect import bisect_left
+from contextvars import ContextVar
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+# Ghi log câu SQL chạy lâu hơn ngưỡng này (ms), 0 = tắt
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Loại câu SQL dùng làm nhãn (giới hạn số nhãn)
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Bộ đếm chỉ tăng, theo bộ nhãn"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Giá trị tăng/giảm được (vd. số request đang xử lý)"""
+
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    """Histogram với các bucket cố định, theo bộ nhãn"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [số lần theo từng bucket (không cộng dồn), tổng, số lần]
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ("le",), key + (bound,))
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labels, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+http_requests_total = Counter(
+    "http_requests_total", "Số request HTTP", ("method", "route", "status"))
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "Số request đang xử lý")
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request (đến khi gửi xong response)",
+    ("method", "route"), LATENCY_BUCKETS)
+http_request_queries = Histogram(
+    "http_request_db_queries", "Số câu SQL mỗi request (phát hiện N+1)",
+    ("method", "route"), QUERY_COUNT_BUCKETS)
+http_request_db_duration = Histogram(
+    "http_request_db_seconds", "Tổng thời gian chạy SQL mỗi request",
+    ("method", "route"), QUERY_BUCKETS)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Thời gian chạy câu SQL", ("operation",), QUERY_BUCKETS)
+db_slow_queries_total = Counter(
+    "db_slow_queries_total", "Số câu SQL chậm hơn SLOW_QUERY_MS", ("operation",))
+db_errors_total = Counter(
+    "db_errors_total", "Số lỗi database (locked = chờ khóa SQLite quá busy_timeout)", ("error",))
+
+REGISTRY = [
+    http_requests_total, http_requests_in_progress, http_request_duration, http_request_queries,
+    http_request_db_duration, db_query_duration, db_slow_queries_total, db_errors_total,
+]
+
+
+def render_metrics() -> str:
+    """Toàn bộ số liệu theo định dạng text của Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """Số câu SQL và tổng thời gian SQL của request đang xử lý"""
+
+    __slots__ = ("path", "queries", "query_seconds")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Request hiện tại; được thread/greenlet chạy truy vấn kế thừa (run_sync, threadpool)
+current_request = ContextVar("current_request", default=None)
+
+
+def _operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in _OPERATIONS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = _operation(statement)
+    db_query_duration.observe(elapsed, operation)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        db_slow_queries_total.inc(operation)
+        where = f" [{stats.path}]" if stats is not None else ""
+        print(f"🐢 Truy vấn chậm {elapsed * 1000:.1f}ms{where}: {' '.join(statement.split())[:500]}")
+
+
+def _handle_error(exception_context):
+    # Lỗi xảy ra giữa before và after: bỏ mốc thời gian đã đẩy vào
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+    error = exception_context.original_exception
+    db_errors_total.inc("locked" if "database is locked" in str(error) else type(error).__name__)
+
+
+def instrument_engine(engine):
+    """Gắn hook đo truy vấn vào engine (với AsyncEngine thì truyền engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _route_label(scope) -> str:
+    # Dùng mẫu đường dẫn của route (/products/{product_id}) để số nhãn không tăng theo id
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return "other"
+
+
+class MetricsMiddleware:
+    """ASGI middleware đo thời gian (đến khi gửi xong body, kể cả response stream), số câu và thời gian SQL mỗi request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["path"])
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec()
+            method, route = scope["method"], _route_label(scope)
+            http_requests_total.inc(method, route, str(status))
+            http_request_duration.observe(elapsed, method, route)
+            http_request_queries.observe(stats.queries, method, route)
+            http_request_db_duration.observe(stats.query_seconds, method, route)
+            current_request.reset(token)
@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, tuple_
+
+# Số sản phẩm mặc định trên mỗi trang
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values) -> str:
+    """Mã hóa giá trị khóa sắp xếp của dòng cuối trang thành cursor"""
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int):
+    """Giải mã cursor, raise ValueError nếu cursor không hợp lệ"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor không hợp lệ") from e
+
+    if not isinstance(payload, list) or len(payload) != size:
+        raise ValueError("Cursor không hợp lệ")
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            try:
+                value = datetime.fromisoformat(value["dt"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError("Cursor không hợp lệ") from e
+        values.append(value)
+    return values
+
+
+def _after(keys, values):
+    """Điều kiện "đứng sau cursor" cho danh sách khóa (expr, descending)
+
+    Các khóa cùng chiều dùng so sánh row value, SQLite đọc tiếp index theo khoảng
+    (kể cả khi đã có điều kiện khoảng khác trên cùng cột):
+    (created_at, id) < (:c, :id)
+
+    Khác chiều thì tách thành OR:
+    created_at < :c OR (created_at = :c AND id > :id)
+    """
+    directions = {descending for _, descending in keys}
+    if len(directions) == 1:
+        left, right = tuple_(*(expr for expr, _ in keys)), tuple_(*values)
+        return left < right if directions.pop() else left > right
+
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if descending else expr > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def keyset_page(query, keys, key_of, cursor: str = "", limit: int = PAGE_SIZE):
+    """Lấy một trang theo keyset pagination
+
+    Args:
+        query: Query đã có filter
+        keys: Danh sách (cột, descending) dùng để sắp xếp, cột cuối phải duy nhất
+        key_of: Hàm lấy giá trị các khóa từ một dòng kết quả
+        cursor: Cursor của trang trước (rỗng = trang đầu)
+        limit: Số dòng mỗi trang
+
+    Returns:
+        (rows, next_cursor) - next_cursor là None nếu đã hết dữ liệu
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        query = query.filter(_after(keys, values))
+
+    query = query.order_by(*[expr.desc() if descending else expr.asc() for expr, descending in keys])
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key_of(rows[-1]))
+    return rows, next_cursor
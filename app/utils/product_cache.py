@@ -0,0 +1,124 @@
+"""
+Cache sản phẩm trong bộ nhớ (đọc qua cache), khóa theo id và SKU
+
+Lưu bản chụp bất biến (ProductSnapshot) thay vì object ORM gắn với session.
+Mọi route ghi vào bảng products gọi invalidate_product/clear_product_cache
+sau khi commit; hai hàm này cũng ghi vào phiên bản dùng chung (shared_version)
+để các worker khác xóa đúng các sản phẩm đó (hoặc toàn bộ) ở lần đọc kế tiếp.
+TTL là lưới an toàn cho thay đổi không đi qua ứng dụng (sửa trực tiếp file database).
+"""
+
+from datetime import datetime
+import os
+import threading
+from typing import NamedTuple, Optional
+
+from app.models import Product
+from app.utils.cache import LRUCache
+from app.utils.shared_version import bump_version, check_version, on_version_change
+
+# Số sản phẩm giữ trong cache và thời gian sống của mỗi bản chụp (giây)
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "5000"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "30"))
+
+
+class ProductSnapshot(NamedTuple):
+    """Bản chụp một dòng products, dùng được ngoài session (template, cache)"""
+    id: int
+    name: str
+    sku: str
+    price: float
+    quantity: Optional[int]
+    reorder_threshold: int
+    threshold_override: bool
+    category: Optional[str]
+    description: Optional[str]
+    images: tuple
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(
+            product.id, product.name, product.sku, product.price, product.quantity,
+            product.reorder_threshold, bool(product.threshold_override), product.category, product.description,
+            tuple(product.images or ()), product.created_at, product.updated_at,
+        )
+
+
+# product.id -> ProductSnapshot
+product_cache = LRUCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+# sku -> product.id (kiểm tra lại bằng snapshot.sku khi đọc)
+sku_cache = LRUCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+
+# Tăng mỗi lần xóa cache: bản chụp đọc trước khi xóa không được ghi vào cache
+_generation = 0
+_lock = threading.Lock()
+
+
+def _store(snapshot: ProductSnapshot, generation: int):
+    with _lock:
+        if generation != _generation:
+            return
+        product_cache.set(snapshot.id, snapshot)
+        sku_cache.set(snapshot.sku, snapshot.id)
+
+
+def get_product(db, product_id: int) -> Optional[ProductSnapshot]:
+    """Bản chụp sản phẩm theo id (None nếu không tồn tại), chỉ truy vấn khi cache miss"""
+    check_version()
+    snapshot = product_cache.get(product_id)
+    if snapshot is not None:
+        return snapshot
+
+    generation = _generation
+    product = db.get(Product, product_id)
+    if product is None:
+        return None
+    snapshot = ProductSnapshot.from_product(product)
+    _store(snapshot, generation)
+    return snapshot
+
+
+def cached_product_by_sku(sku: str) -> Optional[ProductSnapshot]:
+    """Sản phẩm đang giữ SKU theo cache, không truy vấn database (None = không biết)"""
+    check_version()
+    product_id = sku_cache.get(sku)
+    if product_id is None:
+        return None
+    snapshot = product_cache.get(product_id)
+    # SKU đã đổi sang giá trị khác từ khi được cache
+    if snapshot is None or snapshot.sku != sku:
+        return None
+    return snapshot
+
+
+def invalidate_product(*product_ids: int):
+    """Xóa bản chụp của các sản phẩm ở mọi worker (gọi sau khi commit thay đổi)"""
+    _drop(product_ids)
+    bump_version(*product_ids)
+
+
+@on_version_change
+def _drop(product_ids=None):
+    # product_ids=None: xóa toàn bộ
+    global _generation
+    with _lock:
+        _generation += 1
+        if product_ids is None:
+            product_cache.clear()
+            sku_cache.clear()
+        else:
+            for product_id in product_ids:
+                product_cache.pop(product_id)
+
+
+def clear_product_cache():
+    """Xóa toàn bộ cache sản phẩm ở mọi worker (sau khi cập nhật hàng loạt)"""
+    _drop()
+    bump_version()
+
+
+def product_cache_stats() -> dict:
+    """Số liệu hit/miss của cache theo id và theo SKU"""
+    return {"by_id": product_cache.stats(), "by_sku": sku_cache.stats()}
@@ -0,0 +1,145 @@
+import re
+import unicodedata
+
+from sqlalchemy import literal_column, text
+from sqlalchemy.sql import column, table
+from sqlalchemy.exc import OperationalError
+
+from app.models import Product
+
+# Bảng FTS5 dùng để tìm kiếm sản phẩm theo tên/SKU
+FTS_TABLE = "products_fts"
+
+# Trọng số bm25 cho từng cột (name, sku) - khớp SKU được ưu tiên hơn
+FTS_RANK = "bm25(1.0, 2.0)"
+
+# Bảng FTS5 dạng "nhẹ" để join trong query ORM
+products_fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+# Trạng thái FTS5, được xác định khi khởi tạo database
+_fts_enabled = False
+
+# Chữ "đ" không có dạng tách dấu trong Unicode nên phải thay thủ công,
+# phần dấu còn lại do tokenizer unicode61 (remove_diacritics 2) xử lý
+_FOLD_SQL = "replace(replace({0}, 'đ', 'd'), 'Đ', 'D')"
+
+_SEARCH_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, sku, tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, sku)
+        VALUES (new.id, {_FOLD_SQL.format('new.name')}, new.sku);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, sku ON products BEGIN
+        UPDATE {FTS_TABLE}
+        SET name = {_FOLD_SQL.format('new.name')}, sku = new.sku
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+
+def fold_text(value: str) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường ("Bàn phím" -> "ban phim")"""
+    value = value.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def build_match_query(search: str):
+    """Chuyển chuỗi tìm kiếm thành câu truy vấn FTS5 (mỗi từ khớp theo tiền tố)"""
+    tokens = re.findall(r"\w+", fold_text(search))
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def setup_search_index(engine) -> bool:
+    """Tạo bảng FTS5 và trigger đồng bộ với bảng products
+
+    Trả về False nếu SQLite không hỗ trợ FTS5, khi đó tìm kiếm dùng ilike.
+    """
+    global _fts_enabled
+
+    if engine.dialect.name != "sqlite":
+        _fts_enabled = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            for statement in _SEARCH_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', :rank)"
+                ), {"rank": FTS_RANK})
+                rebuild_search_index(conn)
+    except OperationalError as e:
+        print(f"⚠️  FTS5 không khả dụng, dùng tìm kiếm ilike: {e}")
+        _fts_enabled = False
+        return False
+
+    _fts_enabled = True
+    return True
+
+
+def detect_search_index(engine) -> bool:
+    """Bật tìm kiếm FTS5 nếu bảng đã có sẵn (khi init_db bỏ qua bước setup)"""
+    global _fts_enabled
+
+    if engine.dialect.name != "sqlite":
+        _fts_enabled = False
+        return False
+
+    with engine.connect() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+    _fts_enabled = exists is not None
+    return _fts_enabled
+
+
+def rebuild_search_index(conn):
+    """Dựng lại toàn bộ chỉ mục tìm kiếm từ bảng products"""
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, name, sku) "
+        f"SELECT id, {_FOLD_SQL.format('name')}, sku FROM products"
+    ))
+
+
+def apply_search(query, search: str):
+    """Thêm điều kiện tìm kiếm theo tên/SKU vào query
+
+    Trả về (query, ranked). Khi dùng FTS5 kết quả được sắp xếp theo độ liên quan.
+    """
+    match = build_match_query(search) if _fts_enabled else None
+
+    # Fallback: quét bằng ilike khi không có FTS5 hoặc chuỗi không có từ nào
+    if match is None:
+        query = query.filter(
+            (Product.name.ilike(f"%{search}%")) |
+            (Product.sku.ilike(f"%{search}%"))
+        )
+        return query, False
+
+    query = query.join(products_fts, products_fts.c.rowid == Product.id).filter(
+        literal_column(FTS_TABLE).op("MATCH")(match)
+    )
+    return query, True
@@ -0,0 +1,135 @@
+"""
+Phiên bản dữ liệu dùng chung giữa các worker uvicorn (file nhỏ được mmap)
+
+File gồm một bộ đếm và vòng đệm CHANGE_RING id sản phẩm vừa thay đổi. Sau khi
+commit, worker tăng bộ đếm (khóa file) và ghi id đã đổi vào vòng đệm
+(bump_version). Trước khi đọc cache, mỗi worker so bộ đếm với giá trị đã thấy
+lần trước (check_version): không đổi thì chỉ tốn một lần đọc bộ nhớ, đổi thì
+chỉ xóa các id trong vòng đệm. Xóa toàn bộ cache khi có thay đổi hàng loạt
+(id 0) hoặc đã lỡ quá CHANGE_RING thay đổi.
+
+Chỉ đồng bộ các process trên cùng một máy.
+"""
+
+from contextlib import contextmanager
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+VERSION_FILE = os.getenv("CACHE_VERSION_FILE", os.path.join("data", ".cache_version"))
+
+# Số thay đổi gần nhất được ghi lại theo id
+CHANGE_RING = 1024
+
+# id 0 trong vòng đệm = xóa toàn bộ cache
+CLEAR_ALL = 0
+
+_COUNTER = struct.Struct("<Q")
+_SLOT = struct.Struct("<q")
+_SIZE = _COUNTER.size + CHANGE_RING * _SLOT.size
+
+_fd = None
+_mmap = None
+_seen = None
+_listeners = []
+_lock = threading.Lock()
+
+
+def _version_map():
+    global _fd, _mmap
+    if _mmap is None:
+        with _lock:
+            if _mmap is None:
+                os.makedirs(os.path.dirname(VERSION_FILE) or ".", exist_ok=True)
+                fd = os.open(VERSION_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+                if os.fstat(fd).st_size < _SIZE:
+                    os.ftruncate(fd, _SIZE)
+                # Giữ fd mở để khóa file khi ghi; gán _fd trước, _mmap sau cùng vì
+                # thread khác thấy _mmap khác None thì dùng luôn _fd mà không lấy khóa
+                _fd = fd
+                _mmap = mmap.mmap(fd, _SIZE)
+    return _mmap
+
+
+@contextmanager
+def _file_lock():
+    if fcntl is not None:
+        fcntl.flock(_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(_fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(_fd, 0, os.SEEK_SET)
+        msvcrt.locking(_fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            os.lseek(_fd, 0, os.SEEK_SET)
+            msvcrt.locking(_fd, msvcrt.LK_UNLCK, 1)
+
+
+def _slot_offset(version: int) -> int:
+    return _COUNTER.size + (version % CHANGE_RING) * _SLOT.size
+
+
+def current_version() -> int:
+    """Giá trị hiện tại của bộ đếm"""
+    return _COUNTER.unpack_from(_version_map(), 0)[0]
+
+
+def bump_version(*product_ids: int):
+    """Báo cho mọi worker rằng các sản phẩm đã thay đổi (không truyền id = xóa toàn bộ), gọi sau khi commit"""
+    version_map = _version_map()
+    changes = product_ids or (CLEAR_ALL,)
+    if len(changes) > CHANGE_RING:
+        changes = (CLEAR_ALL,)
+    with _file_lock():
+        version = _COUNTER.unpack_from(version_map, 0)[0]
+        for product_id in changes:
+            version += 1
+            _SLOT.pack_into(version_map, _slot_offset(version), product_id)
+        # Ghi id trước, bộ đếm sau: worker đọc bộ đếm mới thì id đã có trong vòng đệm
+        _COUNTER.pack_into(version_map, 0, version)
+
+
+def on_version_change(listener):
+    """Đăng ký hàm xóa cache: listener(ids), ids=None nghĩa là xóa toàn bộ"""
+    _listeners.append(listener)
+    return listener
+
+
+def _changed_ids(seen: int, version: int):
+    """Các id đổi trong (seen, version], None nếu phải xóa toàn bộ"""
+    if seen is None or version - seen > CHANGE_RING or version < seen:
+        return None
+    version_map = _version_map()
+    ids = {_SLOT.unpack_from(version_map, _slot_offset(v))[0] for v in range(seen + 1, version + 1)}
+    # Worker khác ghi vòng qua các ô vừa đọc
+    if current_version() - seen > CHANGE_RING or CLEAR_ALL in ids:
+        return None
+    return ids
+
+
+def check_version() -> bool:
+    """Xóa khỏi các cache đã đăng ký những gì worker khác đã đổi từ lần kiểm tra trước"""
+    global _seen
+    version = current_version()
+    if version == _seen:
+        return False
+    with _lock:
+        if version == _seen:
+            return False
+        ids = _changed_ids(_seen, version)
+        # Xóa xong mới ghi nhận, thread khác không đọc được cache cũ trong lúc đang xóa
+        for listener in _listeners:
+            listener(ids)
+        _seen = version
+    return True
@@ -0,0 +1,127 @@
+"""
+Điều chỉnh tồn kho hàng loạt theo SKU
+
+Mỗi lô là một transaction: số lượng được cộng/trừ ngay trong câu UPDATE
+(quantity = quantity + delta) nên các lần gọi đồng thời không ghi đè lên nhau.
+Thiếu SKU hoặc tồn kho bị âm thì cả lô bị từ chối.
+"""
+
+from datetime import datetime
+import os
+
+from sqlalchemy import bindparam, delete, func, insert, select
+
+from app.models import Product, StockMovement
+from app.utils.audit_log import log_entry, write_product_logs
+
+# Số dòng tối đa trong một lần điều chỉnh
+STOCK_ADJUST_MAX_ITEMS = int(os.getenv("STOCK_ADJUST_MAX_ITEMS", "10000"))
+
+# Giá trị tuyệt đối tối đa của delta (mỗi dòng và sau khi cộng dồn theo SKU)
+STOCK_ADJUST_MAX_DELTA = int(os.getenv("STOCK_ADJUST_MAX_DELTA", "1000000000"))
+
+_products = Product.__table__
+_QUANTITY = func.coalesce(_products.c.quantity, 0)
+
+# Câu UPDATE dùng chung cho cả lô (executemany). Dùng bảng thay vì model
+# để SQLAlchemy không chuyển sang chế độ bulk update theo khóa chính.
+_ADJUST = (
+    _products.update()
+    .where(_products.c.sku == bindparam("b_sku"))
+    .where(_QUANTITY + bindparam("b_delta") >= 0)
+    .values(quantity=_QUANTITY + bindparam("b_delta"))
+)
+
+
+class StockAdjustmentError(ValueError):
+    """Lô điều chỉnh bị từ chối, `errors` là lỗi theo từng SKU"""
+
+    def __init__(self, message: str, errors: list = None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def aggregate_deltas(adjustments) -> dict:
+    """Cộng dồn delta theo SKU (giữ thứ tự xuất hiện), bỏ SKU có tổng thay đổi bằng 0"""
+    totals = {}
+    for sku, delta in adjustments:
+        totals[sku] = totals.get(sku, 0) + delta
+    return {sku: delta for sku, delta in totals.items() if delta}
+
+
+def _rejections(db, deltas: dict) -> list:
+    """Lý do từng SKU không điều chỉnh được (đọc lại sau khi rollback)"""
+    current = dict(db.execute(
+        select(_products.c.sku, _QUANTITY).where(_products.c.sku.in_(list(deltas)))
+    ).all())
+    errors = []
+    for sku, delta in deltas.items():
+        if sku not in current:
+            errors.append({"sku": sku, "error": "SKU không tồn tại"})
+        elif current[sku] + delta < 0:
+            errors.append({"sku": sku, "error": "Không đủ tồn kho", "quantity": current[sku], "delta": delta})
+    return errors
+
+
+def adjust_stock(db, adjustments, changed_by: str = "admin") -> list:
+    """
+    Cộng/trừ tồn kho cho danh sách (sku, delta), ghi stock_movements và log
+
+    Không commit khi thành công. Lỗi thì rollback và raise StockAdjustmentError.
+    Trả về số lượng mới của từng SKU.
+    """
+    deltas = aggregate_deltas(adjustments)
+    if not deltas:
+        return []
+    if len(deltas) > STOCK_ADJUST_MAX_ITEMS:
+        raise StockAdjustmentError(f"Tối đa {STOCK_ADJUST_MAX_ITEMS} SKU mỗi lần điều chỉnh")
+    too_large = [
+        {"sku": sku, "error": f"Tổng delta vượt quá ±{STOCK_ADJUST_MAX_DELTA}", "delta": delta}
+        for sku, delta in deltas.items() if abs(delta) > STOCK_ADJUST_MAX_DELTA
+    ]
+    if too_large:
+        raise StockAdjustmentError("Delta quá lớn", too_large)
+
+    params = [{"b_sku": sku, "b_delta": delta} for sku, delta in deltas.items()]
+    # Câu ghi đầu tiên giữ khóa ghi của SQLite đến khi commit/rollback
+    updated = db.execute(_ADJUST, params).rowcount
+    if updated != len(deltas):
+        db.rollback()
+        errors = _rejections(db, deltas)
+        raise StockAdjustmentError(
+            "Điều chỉnh tồn kho bị từ chối" if errors else "Tồn kho vừa thay đổi, vui lòng thử lại",
+            errors,
+        )
+
+    # Vẫn trong transaction đang giữ khóa ghi nên số lượng đọc lại là kết quả của lô này
+    rows = db.execute(
+        select(_products.c.id, _products.c.sku, _QUANTITY.label("quantity"))
+        .where(_products.c.sku.in_(list(deltas)))
+    ).all()
+
+    now = datetime.utcnow()
+    movements = []
+    logs = []
+    for row in rows:
+        delta = deltas[row.sku]
+        movements.append({
+            "product_id": row.id,
+            "delta": delta,
+            "quantity_after": row.quantity,
+            "changed_by": changed_by,
+            "created_at": now,
+        })
+        logs.append(log_entry(row.id, "update", "quantity", str(row.quantity - delta), str(row.quantity), changed_by))
+    db.execute(insert(StockMovement), movements)
+    write_product_logs(db, logs)
+
+    return [
+        {"sku": row.sku, "product_id": row.id, "delta": deltas[row.sku], "quantity": row.quantity}
+        for row in rows
+    ]
+
+
+def delete_stock_movements(db, product_id: int) -> int:
+    """Xóa lịch sử điều chỉnh tồn kho của sản phẩm (gọi trong transaction xóa sản phẩm)"""
+    # SQLite không bật foreign key nên không thể dựa vào ON DELETE CASCADE
+    return db.execute(delete(StockMovement).where(StockMovement.product_id == product_id)).rowcount
@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+from fastapi.responses import StreamingResponse
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from app.utils.cache import LRUCache
+from app.utils.thumbnails import thumbnail_urls
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+# Gom các đoạn nhỏ do template sinh ra thành chunk trước khi gửi
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Số card sản phẩm đã render được giữ trong cache
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "2000"))
+
+# product.id -> (product.updated_at, HTML card)
+card_cache = LRUCache(CARD_CACHE_SIZE)
+
+# auto_reload=False: template đã biên dịch được giữ trong bộ nhớ, không kiểm tra file mỗi request
+templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+templates.globals["thumbnail_urls"] = thumbnail_urls
+templates.filters["number"] = lambda value, digits=0: f"{value:,.{digits}f}"
+
+
+def render_card(product) -> Markup:
+    """HTML card của một sản phẩm, lấy từ cache nếu sản phẩm chưa thay đổi (cùng updated_at)"""
+    # Card của phiên bản cũ (khác updated_at) tính là miss để số liệu hit/miss đúng
+    cached = card_cache.get(product.id, valid=lambda entry: entry[0] == product.updated_at)
+    if cached is not None:
+        return cached[1]
+
+    html = Markup(templates.get_template("products/_card.html").render(product=product))
+    # Chưa có thumbnail thì card đang dùng ảnh gốc, không cache để lần sau dùng thumbnail
+    if not product.images or thumbnail_urls(product.images[0]) is not None:
+        card_cache.set(product.id, (product.updated_at, html))
+    return html
+
+
+def thumbnails_ready(filenames) -> bool:
+    """Mọi ảnh đều đã có thumbnail (trang render lúc này không dùng ảnh gốc thay thế)"""
+    return all(thumbnail_urls(filename) is not None for filename in filenames)
+
+
+def invalidate_card(product_id: int):
+    """Xóa card đã cache của sản phẩm (gọi khi sửa/xóa sản phẩm)"""
+    card_cache.pop(product_id)
+
+
+templates.globals["render_card"] = render_card
+
+
+def _template_fingerprint() -> str:
+    digest = hashlib.sha1()
+    for name in sorted(templates.list_templates(extensions=["html"])):
+        source, _, _ = templates.loader.get_source(templates, name)
+        digest.update(name.encode("utf-8"))
+        digest.update(source.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+# Thay đổi khi sửa template, dùng trong ETag để trình duyệt không giữ giao diện cũ
+TEMPLATE_VERSION = _template_fingerprint()
+
+
+def precompile_templates():
+    """Biên dịch trước toàn bộ template (gọi khi khởi động)"""
+    for name in templates.list_templates(extensions=["html"]):
+        templates.get_template(name)
+
+
+def _chunks(parts, size: int):
+    buffer = []
+    buffered = 0
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def render_stream(name: str, status_code: int = 200, headers: dict = None, **context) -> StreamingResponse:
+    """Render template theo kiểu stream: gửi phần đầu trang ngay, không chờ dựng xong cả trang"""
+    parts = templates.get_template(name).generate(**context)
+    return StreamingResponse(
+        _chunks(parts, STREAM_CHUNK_SIZE),
+        status_code=status_code,
+        headers=headers,
+        media_type="text/html",
+    )
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from app.utils.uploads import UPLOAD_DIR
+
+# Thư mục chứa ảnh thu nhỏ, URL: /static/uploads/thumbs/<tên>
+THUMB_DIR = os.path.join(UPLOAD_DIR, "thumbs")
+
+# Cạnh dài tối đa (px): sm cho màn hình thường, md cho màn hình 2x
+THUMB_SIZES = {"sm": 100, "md": 200}
+THUMB_FORMATS = {"jpg": ("JPEG", {"quality": 80, "optimize": True}), "webp": ("WEBP", {"quality": 80, "method": 4})}
+
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Không fork trực tiếp process uvicorn (đang có nhiều thread, process con có thể
+# kế thừa lock đang bị giữ): dùng forkserver, Windows không có thì dùng spawn
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_executor = None
+_pending = set()
+_failed = set()
+_lock = threading.Lock()
+
+os.makedirs(THUMB_DIR, exist_ok=True)
+
+
+def _thumb_name(filename: str, size: str, ext: str) -> str:
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_{size}.{ext}"
+
+
+def generate_thumbnails(filename: str, upload_dir: str = UPLOAD_DIR, thumb_dir: str = THUMB_DIR):
+    """Tạo các bản thu nhỏ JPEG/WebP cho một ảnh (chạy trong process pool)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(upload_dir, filename)) as original:
+        largest = max(THUMB_SIZES.values())
+        # JPEG: giải mã ở độ phân giải thấp luôn, nhanh hơn nhiều với ảnh lớn
+        original.draft("RGB", (largest * 2, largest * 2))
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    for size, pixels in THUMB_SIZES.items():
+        thumb = image.copy()
+        thumb.thumbnail((pixels, pixels))
+        for ext, (image_format, options) in THUMB_FORMATS.items():
+            path = os.path.join(thumb_dir, _thumb_name(filename, size, ext))
+            tmp_path = f"{path}.part"
+            thumb.save(tmp_path, image_format, **options)
+            os.replace(tmp_path, path)
+    return filename
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context(_START_METHOD)
+        )
+    return _executor
+
+
+def _on_done(filename: str, future):
+    with _lock:
+        _pending.discard(filename)
+        # Bị hủy khi tắt pool: không tính là lỗi, lần sau vẫn được lên lịch lại
+        if not future.cancelled() and future.exception() is not None:
+            _failed.add(filename)
+
+
+def schedule_thumbnails(filenames):
+    """Đưa các ảnh vào hàng đợi tạo thumbnail (không chờ kết quả)"""
+    for filename in filenames:
+        with _lock:
+            if filename in _pending or filename in _failed:
+                continue
+            _pending.add(filename)
+        future = _get_executor().submit(generate_thumbnails, filename)
+        future.add_done_callback(lambda f, name=filename: _on_done(name, f))
+
+
+def thumbnail_urls(filename: str):
+    """URL các bản thu nhỏ {"jpg": (1x, 2x), "webp": (1x, 2x)}
+
+    Trả về None (và lên lịch tạo thumbnail) nếu chưa có, khi đó dùng ảnh gốc.
+    """
+    if not os.path.exists(os.path.join(THUMB_DIR, _thumb_name(filename, "md", "webp"))):
+        if os.path.exists(os.path.join(UPLOAD_DIR, filename)):
+            schedule_thumbnails([filename])
+        return None
+    return {
+        ext: tuple(f"/static/uploads/thumbs/{_thumb_name(filename, size, ext)}" for size in THUMB_SIZES)
+        for ext in THUMB_FORMATS
+    }
+
+
+def remove_thumbnails(filenames):
+    """Xóa các bản thu nhỏ của ảnh"""
+    for filename in filenames:
+        for size in THUMB_SIZES:
+            for ext in THUMB_FORMATS:
+                try:
+                    os.remove(os.path.join(THUMB_DIR, _thumb_name(filename, size, ext)))
+                except FileNotFoundError:
+                    pass
+
+
+def shutdown_thumbnail_pool():
+    """Dừng process pool khi tắt ứng dụng"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
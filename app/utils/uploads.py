@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import uuid
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+# Thư mục lưu ảnh sản phẩm
+UPLOAD_DIR = "static/uploads"
+
+# Đọc/ghi theo từng chunk để không giữ cả file trong bộ nhớ
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Giới hạn dung lượng: mỗi ảnh và tổng ảnh trong một request
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(30 * 1024 * 1024)))
+
+# Tối đa 5 ảnh mỗi sản phẩm, tối đa 40 megapixel mỗi ảnh
+MAX_IMAGES = 5
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Định dạng Pillow -> phần mở rộng file được lưu
+ALLOWED_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# Chữ ký đầu file để loại sớm file không phải ảnh trước khi ghi hết
+_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n")
+
+# Tên file theo nội dung: sha256 (+ kích thước thumbnail) + phần mở rộng
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}(_(sm|md))?\.(jpg|png|webp)$")
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+
+class UploadError(ValueError):
+    """Lỗi upload ảnh, kèm HTTP status code tương ứng"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _megabytes(size: int) -> str:
+    return f"{round(size / (1024 * 1024), 1):g}"
+
+
+def _looks_like_image(head: bytes) -> bool:
+    if head.startswith(_SIGNATURES):
+        return True
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+
+def _probe_image(path: str) -> str:
+    """Kiểm tra ảnh bằng Pillow (chỉ đọc header, không giải mã toàn bộ ảnh)
+
+    Trả về phần mở rộng file theo định dạng thực tế.
+    """
+    # Pillow chỉ cần khi có upload, không nạp lúc khởi động
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+    except Exception as e:
+        raise UploadError("File không phải ảnh hợp lệ") from e
+
+    if image_format not in ALLOWED_FORMATS:
+        raise UploadError("Chỉ hỗ trợ ảnh JPG, PNG, WEBP")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadError("Kích thước ảnh quá lớn", status_code=413)
+    return ALLOWED_FORMATS[image_format]
+
+
+async def _remove_quietly(path: str):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def save_image(image, budget: int) -> tuple:
+    """
+    Stream một file upload xuống đĩa theo từng chunk, không chặn event loop
+
+    File được đặt tên theo sha256 của nội dung, nếu đã có file giống hệt
+    thì dùng lại file cũ (không lưu trùng).
+
+    Args:
+        image: UploadFile
+        budget: Số byte còn được phép ghi trong request này
+
+    Returns:
+        (tên file, số byte đã ghi)
+    """
+    tmp_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await image.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not _looks_like_image(chunk):
+                    raise UploadError("Chỉ hỗ trợ ảnh JPG, PNG, WEBP")
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise UploadError(f"Ảnh vượt quá {_megabytes(MAX_IMAGE_BYTES)}MB", status_code=413)
+                if size > budget:
+                    raise UploadError(f"Tổng dung lượng ảnh vượt quá {_megabytes(MAX_UPLOAD_BYTES)}MB", status_code=413)
+                digest.update(chunk)
+                await out.write(chunk)
+
+        if size == 0:
+            raise UploadError("File ảnh rỗng")
+
+        file_ext = await run_in_threadpool(_probe_image, tmp_path)
+        filename = f"{digest.hexdigest()}{file_ext}"
+        filepath = os.path.join(UPLOAD_DIR, filename)
+        try:
+            # Dùng lại file cũ: cập nhật mtime để task dọn ảnh không xóa file trước khi request commit
+            await run_in_threadpool(os.utime, filepath)
+            await _remove_quietly(tmp_path)
+        except FileNotFoundError:
+            await aiofiles.os.replace(tmp_path, filepath)
+        return filename, size
+    except BaseException:
+        await _remove_quietly(tmp_path)
+        raise
+
+
+async def save_images(images) -> list:
+    """Lưu tối đa MAX_IMAGES ảnh (bỏ ảnh trùng nội dung trong cùng request)
+
+    Ảnh đã lưu không bị xóa khi request lỗi vì có thể đang được sản phẩm khác
+    dùng chung; file không còn tham chiếu sẽ được dọn bởi gc_orphan_images.
+    """
+    saved = []
+    budget = MAX_UPLOAD_BYTES
+    for image in images[:MAX_IMAGES]:
+        if not image.filename:
+            continue
+        filename, size = await save_image(image, budget)
+        budget -= size
+        if filename not in saved:
+            saved.append(filename)
+    return saved
+
+
+def is_content_addressed(filename: str) -> bool:
+    """Ảnh được đặt tên theo hash nội dung (không bao giờ thay đổi)"""
+    return bool(CONTENT_ADDRESSED_NAME.match(filename))
@@ -0,0 +1,92 @@
+"""
+Benchmark độ trễ khi có nhiều request đồng thời
+
+Gửi song song các request "nặng" (tìm kiếm, trang danh sách) và "nhẹ" (API 1
+sản phẩm) tới server đang chạy, in p50/p95/p99 cho từng loại. Nếu handler chặn
+event loop, request nhẹ phải chờ request nặng và p99 của chúng tăng vọt.
+
+Cách dùng:
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.concurrency --url http://127.0.0.1:8000 --concurrency 50 --requests 2000
+
+So sánh trước/sau: checkout commit cũ, chạy server, chạy lại với cùng tham số.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import statistics
+import time
+import urllib.request
+from urllib.parse import quote
+
+# (tên, đường dẫn) - request nặng và nhẹ xen kẽ nhau
+SCENARIOS = [
+    ("search", "/products/?search=" + quote("bàn phím")),
+    ("list", "/products/"),
+    ("api_page", "/products/api?limit=200"),
+    ("api_one", "/products/api?limit=1&fields=name"),
+    ("api_one", "/products/api?limit=1&fields=sku"),
+]
+
+
+def _fetch(base_url: str, name: str, path: str):
+    started = time.perf_counter()
+    with urllib.request.urlopen(base_url + path, timeout=60) as response:
+        response.read()
+        status = response.status
+    return name, status, time.perf_counter() - started
+
+
+def _percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run(base_url: str, concurrency: int, total: int):
+    """Chạy benchmark, trả về {tên: [độ trễ (giây)]} và tổng thời gian"""
+    jobs = list(itertools.islice(itertools.cycle(SCENARIOS), total))
+    latencies = {}
+    errors = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(_fetch, base_url, name, path) for name, path in jobs]
+        for future in futures:
+            try:
+                name, status, seconds = future.result()
+            except Exception:
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+            latencies.setdefault(name, []).append(seconds)
+    return latencies, time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ với request đồng thời")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Địa chỉ server")
+    parser.add_argument("--concurrency", type=int, default=50, help="Số request song song")
+    parser.add_argument("--requests", type=int, default=1000, help="Tổng số request")
+    args = parser.parse_args()
+
+    # Làm nóng cache của server và database
+    for name, path in SCENARIOS:
+        _fetch(args.url, name, path)
+
+    latencies, elapsed, errors = run(args.url.rstrip("/"), args.concurrency, args.requests)
+
+    print(f"{'request':<10} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, values in latencies.items():
+        ms = [v * 1000 for v in values]
+        print(
+            f"{name:<10} {len(ms):>6} {statistics.median(ms):>9.1f} {_percentile(ms, 95):>9.1f} "
+            f"{_percentile(ms, 99):>9.1f} {max(ms):>9.1f}"
+        )
+    done = sum(len(values) for values in latencies.values())
+    print(f"\nThông lượng: {done / elapsed:.1f} request/giây, lỗi: {errors}, thời gian: {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Benchmark các route chính, chạy app trong cùng process (không cần server)
+
+Mỗi lần chạy dùng một bản sao mới của catalog giả lập (sinh một lần bằng
+benchmarks.generator theo số dòng và seed) nên kết quả lặp lại được. Với mỗi
+kịch bản in p50/p99, thông lượng và RSS lớn nhất; các câu SQL được kiểm tra
+bằng EXPLAIN QUERY PLAN (xem benchmarks.query_plans). Có lỗi HTTP hoặc plan
+vi phạm quy tắc thì thoát với mã 1.
+
+Cách dùng:
+    python -m benchmarks.endpoints --rows 10000
+    python -m benchmarks.endpoints --rows 100000 --iterations 100 --json results.json
+    python -m benchmarks.endpoints --rows 1000000 --export-iterations 1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote, unquote, urlencode, urlsplit
+
+from benchmarks.concurrency import _percentile
+
+BENCH_DIR = os.path.join("data", "bench")
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Không có /proc: dùng đỉnh RSS của cả process (Linux tính bằng KB)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Đo RSS lớn nhất của process trong khối with (lấy mẫu mỗi 5ms)"""
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+async def request(app, method: str, path: str, body: bytes = b"", content_type: str = None):
+    """Gửi một request thẳng vào ASGI app, đọc hết response, trả về (status, số byte)"""
+    url = urlsplit(path)
+    headers = [(b"host", b"benchmark"), (b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "root_path": "",
+        "path": unquote(url.path), "raw_path": url.path.encode(), "query_string": url.query.encode(),
+        "headers": headers, "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+    }
+    finished = asyncio.Event()
+    body_sent = False
+    response = {"status": None, "bytes": 0}
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # StreamingResponse chờ client ngắt kết nối song song với việc gửi
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return response["status"], response["bytes"]
+
+
+def _form(values: dict):
+    return urlencode(values).encode("utf-8"), "application/x-www-form-urlencoded"
+
+
+def build_scenarios(sample: dict, iterations: int, export_iterations: int):
+    """(tên, method, đường dẫn(i), body(i) hoặc None, số lần chạy, status mong đợi)"""
+    targets = sample["targets"]
+
+    def create_body(i):
+        return _form({
+            "name": f"Sản phẩm benchmark {i}", "sku": f"BENCH-{i:07d}",
+            "price": 100_000 + i, "quantity": i % 50, "category": sample["category"],
+        })
+
+    def update_body(i):
+        product = targets[i % len(targets)]
+        return _form({
+            "name": product["name"], "sku": product["sku"], "price": 100_000 + i,
+            "quantity": i % 50, "category": product["category"] or "",
+        })
+
+    return [
+        ("list", "GET", lambda i: "/products/", None, iterations, 200),
+        ("list_search", "GET", lambda i: "/products/?search=" + quote(sample["search"]), None, iterations, 200),
+        ("list_category", "GET", lambda i: "/products/?category=" + quote(sample["category"]), None, iterations, 200),
+        ("create_product", "POST", lambda i: "/products/", create_body, iterations, 303),
+        ("update_product", "POST", lambda i: f"/products/{targets[i % len(targets)]['id']}", update_body, iterations, 303),
+        ("product_logs", "GET", lambda i: f"/products/{sample['hot_product_id']}/logs", None, iterations, 200),
+        ("activity", "GET", lambda i: "/products/activity?action=update&field=quantity", None, iterations, 200),
+        ("export_excel", "GET", lambda i: "/products/export", None, export_iterations, 200),
+    ]
+
+
+def prepare_database(rows: int, seed: int) -> str:
+    """Sinh catalog (nếu chưa có) rồi sao chép ra file chạy benchmark, trả về đường dẫn file chạy"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    catalog = os.path.join(BENCH_DIR, f"catalog_{rows}_{seed}.db")
+    if not os.path.exists(catalog):
+        partial = catalog + ".partial"
+        for path in (partial, partial + "-wal", partial + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        # Process riêng vì DATABASE_URL được đọc một lần khi import app
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.generator", "--rows", str(rows), "--seed", str(seed), "--db", partial],
+            check=True,
+        )
+        os.replace(partial, catalog)
+
+    run_db = os.path.join(BENCH_DIR, "run.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(run_db + suffix):
+            os.remove(run_db + suffix)
+    shutil.copyfile(catalog, run_db)
+    return run_db
+
+
+def load_sample(engine, seed: int) -> dict:
+    """Chọn dữ liệu cho các kịch bản: danh mục lớn nhất, sản phẩm nhiều log nhất, sản phẩm để sửa"""
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        category = conn.execute(text(
+            "SELECT category FROM category_stats ORDER BY product_count DESC LIMIT 1"
+        )).scalar()
+        hot_product_id = conn.execute(text(
+            "SELECT product_id FROM product_logs GROUP BY product_id ORDER BY count(*) DESC LIMIT 1"
+        )).scalar()
+        max_id = conn.execute(text("SELECT max(id) FROM products")).scalar()
+        ids = random.Random(seed).sample(range(1, max_id + 1), min(200, max_id))
+        targets = [dict(row._mapping) for row in conn.execute(
+            text("SELECT id, name, sku, category FROM products WHERE id IN (%s)" % ",".join(map(str, ids)))
+        )]
+    return {"category": category, "search": "bàn phím", "hot_product_id": hot_product_id, "targets": targets}
+
+
+async def run_scenarios(app, engine, scenarios) -> list:
+    """Chạy từng kịch bản (làm nóng 1 lần, ghi lại SQL để kiểm tra plan), trả về kết quả"""
+    from benchmarks.query_plans import capture_statements, check_plans
+
+    results = []
+    await app.router.startup()
+    try:
+        for name, method, path, body, count, expected in scenarios:
+            payload, content_type = body(0) if body else (b"", None)
+            statements = []
+            with capture_statements(statements):
+                await request(app, method, path(0), payload, content_type)
+
+            latencies = []
+            errors = 0
+            with PeakRSS() as rss:
+                started = time.perf_counter()
+                for i in range(1, count + 1):
+                    payload, content_type = body(i) if body else (b"", None)
+                    begin = time.perf_counter()
+                    status, _ = await request(app, method, path(i), payload, content_type)
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                    if status != expected:
+                        errors += 1
+                elapsed = time.perf_counter() - started
+
+            results.append({
+                "scenario": name,
+                "requests": count,
+                "errors": errors,
+                "p50_ms": round(statistics.median(latencies), 2),
+                "p99_ms": round(_percentile(latencies, 99), 2),
+                "throughput": round(count / elapsed, 1),
+                "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+                "plan_violations": check_plans(engine, name, statements),
+            })
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def print_results(results: list):
+    print(f"\n{'kịch bản':<16} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'RSS MB':>8} {'lỗi':>5} plan")
+    for result in results:
+        print(
+            f"{result['scenario']:<16} {result['requests']:>5} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+            f"{result['throughput']:>8.1f} {result['peak_rss_mb']:>8.1f} {result['errors']:>5} "
+            f"{'OK' if not result['plan_violations'] else 'LỖI'}"
+        )
+    for result in results:
+        for statement, detail in result["plan_violations"]:
+            print(f"\n❌ {result['scenario']}: {detail}\n   {statement}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các route chính trên dữ liệu giả lập")
+    parser.add_argument("--rows", type=int, default=10_000, help="Số sản phẩm (vd. 10000, 100000, 1000000)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed sinh dữ liệu")
+    parser.add_argument("--iterations", type=int, default=50, help="Số request mỗi kịch bản")
+    parser.add_argument("--export-iterations", type=int, default=3, help="Số lần xuất Excel")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON để so sánh giữa các lần chạy")
+    args = parser.parse_args()
+
+    run_db = prepare_database(args.rows, args.seed)
+    # DATABASE_URL phải được đặt trước khi import app
+    os.environ["DATABASE_URL"] = f"sqlite:///{run_db}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    from app.database import engine
+    from app.main import app
+
+    sample = load_sample(engine, args.seed)
+    scenarios = build_scenarios(sample, args.iterations, args.export_iterations)
+    results = asyncio.run(run_scenarios(app, engine, scenarios))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": args.rows, "seed": args.seed, "results": results}, f, ensure_ascii=False, indent=2)
+
+    if any(result["errors"] or result["plan_violations"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Sinh dữ liệu giả lập (sản phẩm + log) cho benchmark
+
+Dữ liệu có tên/danh mục tiếng Việt, số lượng danh mục lệch (phụ kiện nhiều hơn
+máy in), tồn kho lệch (nhiều sản phẩm hết/sắp hết hàng, một số ít tồn rất
+nhiều) và số log lệch (vài sản phẩm "nóng" bị sửa rất nhiều lần). Cùng `seed`
+luôn cho cùng dữ liệu (thời gian được tính lùi từ lúc sinh).
+
+Cách dùng:
+    python -m benchmarks.generator --rows 100000 --seed 42 --db data/bench/catalog.db
+"""
+
+import argparse
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+import os
+import random
+import time
+
+# Mỗi lô là một transaction, ghi bằng executemany
+GENERATOR_BATCH_SIZE = 5000
+
+# Log nằm trong khoảng này để không bị job dọn log xóa khi app khởi động
+LOG_WINDOW_DAYS = 14
+
+# (danh mục, tỉ trọng, loại sản phẩm, thương hiệu, khoảng giá)
+CATEGORIES = [
+    ("Phụ kiện", 30, ["Chuột không dây", "Bàn phím cơ", "Lót chuột", "Cáp sạc", "Sạc dự phòng", "Giá đỡ laptop"],
+     ["Logitech", "Razer", "Anker", "Ugreen", "Baseus", "Keychron"], (50_000, 3_000_000)),
+    ("Điện thoại", 18, ["Điện thoại", "Điện thoại gập", "Máy tính bảng"],
+     ["Samsung Galaxy", "iPhone", "Xiaomi", "OPPO", "Vivo", "Realme"], (2_000_000, 40_000_000)),
+    ("Laptop", 12, ["Laptop", "Laptop gaming", "Máy tính xách tay"],
+     ["Dell Inspiron", "HP Pavilion", "Lenovo ThinkPad", "Asus Vivobook", "Acer Nitro", "MacBook Air"],
+     (8_000_000, 50_000_000)),
+    ("Linh kiện", 12, ["Ổ cứng SSD", "RAM", "Card màn hình", "Nguồn máy tính", "Tản nhiệt"],
+     ["Samsung", "Kingston", "Corsair", "Gigabyte", "MSI", "Western Digital"], (400_000, 25_000_000)),
+    ("Âm thanh", 10, ["Tai nghe", "Tai nghe chống ồn", "Loa bluetooth", "Micro thu âm"],
+     ["Sony", "JBL", "Marshall", "Sennheiser", "Edifier", "Soundcore"], (300_000, 12_000_000)),
+    ("Màn hình", 8, ["Màn hình", "Màn hình cong", "Màn hình đồ họa"],
+     ["LG", "Dell UltraSharp", "Samsung Odyssey", "ViewSonic", "AOC", "BenQ"], (2_500_000, 20_000_000)),
+    ("Thiết bị mạng", 6, ["Router wifi", "Bộ kích sóng", "Switch mạng", "Camera wifi"],
+     ["TP-Link", "Tenda", "Mercusys", "Asus", "Ezviz", "Imou"], (250_000, 6_000_000)),
+    ("Máy in", 4, ["Máy in laser", "Máy in phun màu", "Máy scan"],
+     ["Canon", "HP LaserJet", "Brother", "Epson"], (2_000_000, 15_000_000)),
+]
+
+VARIANTS = ["chính hãng", "bản quốc tế", "màu đen", "màu trắng", "màu xanh", "cao cấp",
+            "giá rẻ", "mỏng nhẹ", "không dây", "2024", "Pro", "Plus", "Mini"]
+
+DESCRIPTIONS = [
+    "{name}, bảo hành {warranty} tháng, hàng mới 100%.",
+    "{name} nhập khẩu, đổi trả trong 7 ngày nếu lỗi từ nhà sản xuất.",
+    "{name}, phù hợp cho văn phòng và học tập, bảo hành {warranty} tháng.",
+    "{name} bản giới hạn, số lượng có hạn.",
+]
+
+
+# Dùng rng.random() thay cho randint/choice/choices (chậm hơn nhiều lần khi sinh hàng triệu dòng)
+def _int(rng: random.Random, low: int, high: int) -> int:
+    return low + int(rng.random() * (high - low + 1))
+
+
+def _pick(rng: random.Random, items):
+    return items[int(rng.random() * len(items))]
+
+
+_CATEGORY_WEIGHTS = list(accumulate(category[1] for category in CATEGORIES))
+
+
+def _quantity(rng: random.Random) -> int:
+    """Tồn kho lệch: ~10% hết hàng, ~20% dưới ngưỡng, phần còn lại phân phối log-normal"""
+    roll = rng.random()
+    if roll < 0.10:
+        return 0
+    if roll < 0.30:
+        return _int(rng, 1, 4)
+    return min(int(rng.lognormvariate(3.0, 1.2)) + 5, 5000)
+
+
+def _log_count(rng: random.Random) -> int:
+    """Số lần sửa của một sản phẩm (Pareto: đa số 0-2 lần, vài sản phẩm hàng trăm lần)"""
+    return min(int(rng.paretovariate(1.3)) - 1, 300)
+
+
+def generate_products(rows: int, seed: int = 42, now: datetime = None):
+    """Sinh `rows` sản phẩm (dict), id từ 1, created_at tăng dần trong 365 ngày gần nhất"""
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    start = now - timedelta(days=365)
+    step = timedelta(days=365) / max(rows, 1)
+    total_weight = _CATEGORY_WEIGHTS[-1]
+
+    for product_id in range(1, rows + 1):
+        category, _, kinds, brands, (low, high) = CATEGORIES[bisect(_CATEGORY_WEIGHTS, rng.random() * total_weight)]
+        brand = _pick(rng, brands)
+        name = f"{_pick(rng, kinds)} {brand} {_pick(rng, 'ABCDEFGHKMNPSTXZ')}{_int(rng, 1, 999)} {_pick(rng, VARIANTS)}"
+        created_at = start + step * product_id
+        yield {
+            "id": product_id,
+            "name": name,
+            "sku": f"{brand.split()[0][:4].upper()}-{product_id:07d}",
+            "price": round(low + rng.random() * (high - low), -3),
+            "quantity": _quantity(rng),
+            "reorder_threshold": 5,
+            "category": category,
+            "description": _pick(rng, DESCRIPTIONS).format(name=name, warranty=_pick(rng, (6, 12, 24))),
+            "images": [],
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+
+
+def generate_logs(rows: int, seed: int = 42, now: datetime = None):
+    """Sinh log cho sản phẩm 1..rows: một log "create" và số log "update" lệch theo Pareto"""
+    rng = random.Random(seed + 1)
+    now = now or datetime.utcnow()
+    window = LOG_WINDOW_DAYS * 24 * 3600
+
+    for product_id in range(1, rows + 1):
+        yield {
+            "product_id": product_id, "action": "create", "field_name": None, "old_value": None,
+            "new_value": None, "changed_by": "admin",
+            "created_at": now - timedelta(seconds=_int(rng, window // 2, window)),
+        }
+        quantity = _int(rng, 0, 200)
+        for _ in range(_log_count(rng)):
+            if rng.random() < 0.8:
+                new_quantity = max(0, quantity + _int(rng, -20, 20))
+                field, old_value, new_value = "quantity", quantity, new_quantity
+                quantity = new_quantity
+            else:
+                field, old_value, new_value = "price", _int(rng, 1, 500) * 10_000, _int(rng, 1, 500) * 10_000
+            yield {
+                "product_id": product_id, "action": "update", "field_name": field,
+                "old_value": str(old_value), "new_value": str(new_value), "changed_by": _pick(rng, ("admin", "kho", "import")),
+                "created_at": now - timedelta(seconds=_int(rng, 0, window // 2)),
+            }
+
+
+def _batches(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def populate(engine, rows: int, seed: int = 42, now: datetime = None) -> dict:
+    """Ghi dữ liệu giả lập vào database trống, trả về số sản phẩm/log đã ghi"""
+    from sqlalchemy import func, insert, select
+
+    from app.models import Product, ProductLog
+
+    now = now or datetime.utcnow()
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(Product)).scalar():
+            raise ValueError("Database đã có sản phẩm, cần database trống để sinh dữ liệu")
+
+    counts = {"products": 0, "logs": 0}
+    for table, model, items in (
+        ("products", Product, generate_products(rows, seed, now)),
+        ("logs", ProductLog, generate_logs(rows, seed, now)),
+    ):
+        for batch in _batches(items, GENERATOR_BATCH_SIZE):
+            with engine.begin() as conn:
+                conn.execute(insert(model), batch)
+            counts[table] += len(batch)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả lập cho benchmark")
+    parser.add_argument("--rows", type=int, default=10_000, help="Số sản phẩm (vd. 10000, 100000, 1000000)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed để sinh lại đúng dữ liệu")
+    parser.add_argument("--db", default="data/bench/catalog.db", help="File SQLite đích (phải chưa có sản phẩm)")
+    args = parser.parse_args()
+
+    # DATABASE_URL phải được đặt trước khi import app
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    from app.database import engine, init_db
+
+    init_db()
+    started = time.perf_counter()
+    counts = populate(engine, args.rows, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f"Đã ghi {counts['products']} sản phẩm, {counts['logs']} log vào {args.db} trong {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
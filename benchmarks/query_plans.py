@@ -0,0 +1,69 @@
+"""
+Kiểm tra query plan (EXPLAIN QUERY PLAN) của các câu SQL mà route thực sự chạy
+
+Câu SQL được ghi lại trong lúc benchmark (hook before_cursor_execute), sau đó
+chạy EXPLAIN QUERY PLAN với đúng tham số. Plan vi phạm quy tắc của kịch bản
+(quét cả bảng, sắp xếp bằng B-tree tạm, không dùng index mong đợi) được báo lỗi.
+"""
+
+from contextlib import contextmanager
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Quét toàn bảng (không qua index)
+FULL_SCAN = re.compile(r"^SCAN (products|product_logs)$")
+# Lịch sử một sản phẩm phải tìm theo index (SEARCH), không duyệt cả bảng/index log
+LOG_SCAN = re.compile(r"^SCAN product_logs\b")
+# Sắp xếp trong bộ nhớ thay vì đọc theo thứ tự index
+TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR ORDER BY")
+
+# Quy tắc theo kịch bản: danh sách regex bị cấm trong plan
+PLAN_RULES = {
+    "list": [FULL_SCAN, TEMP_SORT],
+    "list_search": [FULL_SCAN],
+    "list_category": [FULL_SCAN, TEMP_SORT],
+    "create_product": [FULL_SCAN],
+    "update_product": [FULL_SCAN],
+    "product_logs": [LOG_SCAN, FULL_SCAN, TEMP_SORT],
+    "activity": [FULL_SCAN, TEMP_SORT],
+    # Xuất Excel đọc toàn bộ dữ liệu nên được phép quét bảng
+    "export_excel": [],
+}
+
+
+@contextmanager
+def capture_statements(statements: list):
+    """Ghi lại (sql, tham số) của mọi câu SELECT chạy trong khối with"""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(conn, statement: str, parameters) -> list:
+    """Các dòng `detail` của EXPLAIN QUERY PLAN"""
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, tuple(parameters or ()))
+    return [row[3] for row in rows]
+
+
+def check_plans(engine, scenario: str, statements) -> list:
+    """Trả về danh sách vi phạm [(sql, dòng plan)] của một kịch bản"""
+    rules = PLAN_RULES.get(scenario, [FULL_SCAN])
+    violations = []
+    seen = set()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            for detail in explain(conn, statement, parameters):
+                if any(rule.search(detail) for rule in rules):
+                    violations.append((" ".join(statement.split()), detail))
+    return violations
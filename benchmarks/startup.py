@@ -0,0 +1,130 @@
+"""
+Benchmark thời gian khởi động: import app, sự kiện startup và request đầu tiên
+
+Mỗi lần đo chạy trong một process Python mới (giống một worker uvicorn vừa
+khởi động) trên bản sao của catalog giả lập (xem benchmarks.endpoints). Đo hai
+trường hợp:
+
+- schema_check: PRAGMA user_version bị xóa, init_db chạy đầy đủ các bước
+  (create_all, kiểm tra cột/index, tạo trigger) như lần khởi động đầu tiên
+- schema_current: schema đã được đánh dấu, init_db chỉ đọc user_version
+
+Thư viện nặng chỉ dùng cho một số request (Pillow, openpyxl) không được nạp
+khi import app; nếu bị nạp thì thoát với mã 1.
+
+Cách dùng:
+    python -m benchmarks.startup --rows 100000 --runs 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.endpoints import prepare_database, request
+
+# Chỉ được nạp khi upload ảnh / xuất, nhập Excel
+LAZY_MODULES = ("PIL", "openpyxl")
+
+PHASES = ("import_ms", "startup_ms", "first_request_ms", "process_ms")
+
+
+def measure():
+    """Chạy trong process con: đo các giai đoạn và in kết quả dạng JSON"""
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+    loaded = [name for name in LAZY_MODULES if name in sys.modules]
+
+    async def boot():
+        await app.router.startup()
+        ready = time.perf_counter()
+        status, _ = await request(app, "GET", "/products/")
+        first = time.perf_counter()
+        await app.router.shutdown()
+        return ready, first, status
+
+    ready, first, status = asyncio.run(boot())
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_request_ms": (first - ready) * 1000,
+        "status": status,
+        "lazy_loaded": loaded,
+    }))
+
+
+def run_once(run_db: str, schema_current: bool) -> dict:
+    """Khởi động app trong một process mới, trả về thời gian từng giai đoạn"""
+    if not schema_current:
+        with sqlite3.connect(run_db) as conn:
+            conn.execute("PRAGMA user_version = 0")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{run_db}")
+    env.pop("ASYNC_DATABASE_URL", None)
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child"],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summarize(name: str, runs: list) -> dict:
+    summary = {"case": name, "runs": len(runs)}
+    for phase in PHASES:
+        summary[phase] = round(statistics.median(run[phase] for run in runs), 1)
+    summary["errors"] = sum(run["status"] != 200 for run in runs)
+    summary["lazy_loaded"] = sorted({name for run in runs for name in run["lazy_loaded"]})
+    return summary
+
+
+def print_results(results: list):
+    print(f"\n{'trường hợp':<16} {'import':>9} {'startup':>9} {'request 1':>10} {'process':>9} {'lỗi':>5}  (ms, median)")
+    for result in results:
+        print(
+            f"{result['case']:<16} {result['import_ms']:>9.1f} {result['startup_ms']:>9.1f} "
+            f"{result['first_request_ms']:>10.1f} {result['process_ms']:>9.1f} {result['errors']:>5}"
+        )
+    for result in results:
+        if result["lazy_loaded"]:
+            print(f"\n❌ {result['case']}: import app nạp luôn {', '.join(result['lazy_loaded'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động ứng dụng")
+    parser.add_argument("--rows", type=int, default=10_000, help="Số sản phẩm của catalog giả lập")
+    parser.add_argument("--seed", type=int, default=42, help="Seed sinh dữ liệu")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần khởi động mỗi trường hợp")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure()
+        return
+
+    run_db = prepare_database(args.rows, args.seed)
+    results = []
+    for name, schema_current in (("schema_check", False), ("schema_current", True)):
+        # Lần đầu để làm nóng page cache của hệ điều hành và đánh dấu schema
+        run_once(run_db, schema_current)
+        results.append(summarize(name, [run_once(run_db, schema_current) for _ in range(args.runs)]))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": args.rows, "seed": args.seed, "results": results}, f, ensure_ascii=False, indent=2)
+
+    if any(result["errors"] or result["lazy_loaded"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
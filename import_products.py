@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Script nhập sản phẩm hàng loạt từ file CSV/XLSX
+
+Cách dùng:
+    python import_products.py catalog.xlsx
+    python import_products.py catalog.csv --batch-size 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Thêm thư mục gốc vào path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import init_db
+from app.utils.importer import IMPORT_BATCH_SIZE, import_file
+from app.utils.shared_version import bump_version
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Nhập sản phẩm hàng loạt từ file CSV/XLSX (upsert theo SKU)")
+    parser.add_argument("file", help="Đường dẫn file .csv hoặc .xlsx")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Số dòng mỗi transaction")
+    parser.add_argument("--changed-by", default="import", help="Tên người thay đổi ghi vào log")
+    args = parser.parse_args()
+
+    init_db()
+
+    print(f"📥 Đang nhập sản phẩm từ {args.file}...")
+    started = time.perf_counter()
+    try:
+        with open(args.file, "rb") as f:
+            result = import_file(f, args.file, args.batch_size, args.changed_by)
+    except (OSError, ValueError) as e:
+        print(f"❌ Lỗi: {e}")
+        sys.exit(1)
+    finally:
+        # Worker đang chạy xóa cache sản phẩm ở request kế tiếp
+        bump_version()
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Đã xử lý {result['total_rows']} dòng trong {elapsed:.1f}s")
+    print(f"   Tạo mới: {result['created']}, cập nhật: {result['updated']}, "
+          f"không đổi: {result['unchanged']}, lỗi: {result['failed']}")
+    for error in result["errors"]:
+        print(f"   ⚠️  Dòng {error['row']} (SKU {error['sku']}): {error['error']}")
+    if result["errors_truncated"]:
+        print(f"   ... và {result['failed'] - len(result['errors'])} lỗi khác")
+    sys.exit(1 if result["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,49 @@
 #!/usr/bin/env python3
 """
-Script khởi tạo database và thêm dữ liệu mẫu
+Script khởi tạo database và thêm dữ liệu
+
+Cách dùng:
+    python init_db.py                                    # 5 sản phẩm mẫu
+    python init_db.py --rows 1000000 --seed 42 --fast    # dữ liệu giả lập (database trống)
+    python init_db.py --fixtures products.csv logs.json  # nạp từ file JSON/CSV/XLSX
+    python init_db.py --reset --rows 100000 --fast       # xóa dữ liệu cũ trước khi nạp
 """
 
+import argparse
+from datetime import datetime
+from itertools import islice
+import json
 import os
 import sys
-from datetime import datetime
+import time
 
 # Thêm thư mục gốc vào path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import init_db, SessionLocal
-from app.models import Product, ProductLog
+from sqlalchemy import func, insert, select, text
+
+from app.database import IS_SQLITE, engine, init_db, invalidate_schema_version, SessionLocal
+from app.models import Base, Product, ProductLog
+from app.utils.data_version import DATABASE_ID
+from app.utils.shared_version import bump_version
+
+# Số dòng mỗi lần executemany/commit khi nạp dữ liệu lớn
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "50000"))
+
+# Các bảng được nạp trực tiếp (trigger/index của chúng bị gỡ tạm thời ở chế độ --fast)
+SEED_TABLES = ("products", "product_logs")
 
 def create_sample_data():
     """Tạo dữ liệu mẫu cho hệ thống"""
     db = SessionLocal()
-    
+
     try:
         # Kiểm tra xem đã có dữ liệu chưa
         existing_products = db.query(Product).count()
         if existing_products > 0:
             print("⚠️  Database đã có dữ liệu, bỏ qua việc tạo dữ liệu mẫu")
             return
-        
+
         # Tạo sản phẩm mẫu
         sample_products = [
             {
@@ -67,50 +87,264 @@ def create_sample_data():
                 "description": "Tai nghe chống ồn Sony WH-1000XM4"
             }
         ]
-        
+
         print("📦 Đang tạo dữ liệu mẫu...")
-        
-        for product_data in sample_products:
-            product = Product(**product_data)
-            db.add(product)
-            db.commit()
-            db.refresh(product)
-            
-            # Tạo log cho sản phẩm mới
-            log = ProductLog(
-                product_id=product.id,
-                action="create",
-                changed_by="admin"
-            )
-            db.add(log)
-            
-            print(f"✅ Đã tạo sản phẩm: {product.name}")
-        
+
+        # Thêm tất cả sản phẩm một lần, log ghi bằng một câu INSERT, commit một lần
+        products = [Product(**product_data) for product_data in sample_products]
+        db.add_all(products)
+        db.flush()
+        db.execute(insert(ProductLog), [
+            {"product_id": product.id, "action": "create", "changed_by": "admin"} for product in products
+        ])
         db.commit()
+
+        for product in products:
+            print(f"✅ Đã tạo sản phẩm: {product.name}")
         print(f"🎉 Đã tạo thành công {len(sample_products)} sản phẩm mẫu!")
-        
+
     except Exception as e:
         print(f"❌ Lỗi khi tạo dữ liệu mẫu: {e}")
         db.rollback()
     finally:
         db.close()
 
+def reset_db():
+    """Xóa toàn bộ bảng (kể cả bảng tìm kiếm FTS5) để init_db tạo lại từ đầu"""
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        if IS_SQLITE:
+            conn.execute(text("DROP TABLE IF EXISTS products_fts"))
+        invalidate_schema_version(conn)
+
+def _parse_datetime(value):
+    if isinstance(value, str) and value:
+        return datetime.fromisoformat(value)
+    return value or None
+
+def read_fixture(path: str):
+    """Đọc file dữ liệu, trả về (danh sách sản phẩm, danh sách log)
+
+    JSON: danh sách sản phẩm hoặc {"products": [...], "logs": [...]}.
+    CSV/XLSX: mỗi dòng một sản phẩm, cùng định dạng với file nhập sản phẩm.
+    Log tham chiếu sản phẩm bằng `product_id` hoặc `sku`.
+    """
+    from app.utils.importer import read_rows
+
+    if os.path.splitext(path)[1].lower() == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return data, []
+        return data.get("products", []), data.get("logs", [])
+
+    with open(path, "rb") as f:
+        return [row for _, row in read_rows(f, path)], []
+
+def _product_rows(items, next_id: int, skus: dict, now: datetime):
+    """Kiểm tra và chuẩn hóa sản phẩm từ file, gán id nếu chưa có"""
+    from app.utils.importer import ImportRowError, validate_row
+    from app.utils.low_stock import LOW_STOCK_THRESHOLD
+
+    for number, item in enumerate(items, start=1):
+        try:
+            row = validate_row(item)
+        except ImportRowError as e:
+            raise ValueError(f"Sản phẩm thứ {number}: {e}")
+        if row["sku"] in skus:
+            raise ValueError(f"Sản phẩm thứ {number}: SKU bị trùng {row['sku']}")
+        row["threshold_override"] = row["reorder_threshold"] is not None
+        if row["reorder_threshold"] is None:
+            row["reorder_threshold"] = LOW_STOCK_THRESHOLD
+        row["id"] = item.get("id") or next_id
+        next_id = max(next_id, row["id"]) + 1
+        row["images"] = item.get("images") or []
+        row["created_at"] = _parse_datetime(item.get("created_at")) or now
+        row["updated_at"] = _parse_datetime(item.get("updated_at")) or row["created_at"]
+        skus[row["sku"]] = row["id"]
+        yield row
+
+def _log_rows(items, skus: dict, now: datetime):
+    """Chuẩn hóa log từ file, đổi `sku` thành product_id"""
+    for number, item in enumerate(items, start=1):
+        product_id = item.get("product_id") or skus.get(item.get("sku"))
+        if not product_id or not item.get("action"):
+            raise ValueError(f"Log thứ {number}: thiếu product_id/sku hợp lệ hoặc action")
+        yield {
+            "product_id": product_id,
+            "action": item["action"],
+            "field_name": item.get("field_name"),
+            "old_value": None if item.get("old_value") is None else str(item["old_value"]),
+            "new_value": None if item.get("new_value") is None else str(item["new_value"]),
+            "changed_by": item.get("changed_by") or "admin",
+            "created_at": _parse_datetime(item.get("created_at")) or now,
+        }
+
+def bulk_insert(conn, model, rows, batch_size: int = SEED_BATCH_SIZE) -> int:
+    """Ghi dữ liệu bằng executemany, mỗi lô một transaction, trả về số dòng đã ghi
+
+    Giá trị được chuyển đổi (datetime, JSON) bằng bind processor của từng cột rồi
+    gửi thẳng tới driver dưới dạng tuple, bỏ qua bước xử lý tham số theo từng
+    dòng của SQLAlchemy (chiếm phần lớn thời gian khi nạp hàng triệu dòng).
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    keys = list(first)
+    table = model.__table__
+    placeholders = ", ".join("?" for _ in keys) if IS_SQLITE else ", ".join("%s" for _ in keys)
+    statement = f"INSERT INTO {table.name} ({', '.join(keys)}) VALUES ({placeholders})"
+    processors = [table.c[key].type.bind_processor(conn.dialect) for key in keys]
+
+    batch_rows = [first, *islice(rows, batch_size - 1)]
+    count = 0
+    while batch_rows:
+        conn.exec_driver_sql(statement, [
+            tuple(process(row[key]) if process else row[key] for key, process in zip(keys, processors))
+            for row in batch_rows
+        ])
+        conn.commit()
+        count += len(batch_rows)
+        batch_rows = list(islice(rows, batch_size))
+    return count
+
+def _drop_triggers_and_indexes(conn):
+    """Gỡ trigger và index của các bảng được nạp (init_db tạo lại sau khi nạp xong)"""
+    triggers = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('products', 'product_logs')"
+    )).scalars().all()
+    for name in triggers:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        if table.name in SEED_TABLES:
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.commit()
+
+def _rebuild_derived_data(conn):
+    """Dựng lại dữ liệu do trigger duy trì: chỉ mục tìm kiếm, thống kê danh mục, tham chiếu ảnh"""
+    from app.utils.category_stats import rebuild_category_stats
+    from app.utils.image_store import rebuild_image_refs
+    from app.utils.search import FTS_TABLE, rebuild_search_index
+
+    has_fts = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    if has_fts:
+        rebuild_search_index(conn)
+    rebuild_category_stats(conn)
+    rebuild_image_refs(conn)
+    # Trigger tăng phiên bản đã bị gỡ trong lúc nạp: tăng thủ công để ETag cũ không còn khớp
+    conn.execute(
+        text("UPDATE data_versions SET version = version + 1 WHERE name != :name"), {"name": DATABASE_ID}
+    )
+    conn.commit()
+
+def load_data(products, logs, fast: bool = False) -> dict:
+    """
+    Nạp sản phẩm và log bằng executemany theo lô lớn
+
+    fast=True (chỉ SQLite): tắt journal và fsync, gỡ trigger/index trong lúc nạp,
+    sau đó dựng lại dữ liệu phụ và index. Nếu bị dừng giữa chừng database có thể
+    hỏng, chỉ dùng khi tạo database mới (staging, test, benchmark).
+    """
+    fast = fast and IS_SQLITE
+    if fast:
+        # Đổi journal_mode cần là kết nối duy nhất đang mở
+        engine.dispose()
+
+    with engine.connect() as conn:
+        if fast:
+            conn.exec_driver_sql("PRAGMA journal_mode=OFF")
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+            invalidate_schema_version(conn)
+            _drop_triggers_and_indexes(conn)
+        try:
+            counts = {
+                "products": bulk_insert(conn, Product, products),
+                "logs": bulk_insert(conn, ProductLog, logs),
+            }
+            if fast:
+                _rebuild_derived_data(conn)
+        finally:
+            if fast:
+                conn.rollback()
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+                conn.exec_driver_sql("PRAGMA synchronous=NORMAL")
+
+    if fast:
+        # Tạo lại index (sau khi có dữ liệu, nhanh hơn cập nhật index từng dòng) và trigger
+        init_db(force=True)
+    return counts
+
+def seed_database(rows: int = None, seed: int = 42, fixtures=(), fast: bool = False) -> dict:
+    """Nạp dữ liệu giả lập (`rows` sản phẩm) hoặc từ các file fixtures"""
+    now = datetime.utcnow()
+    with engine.connect() as conn:
+        next_id = (conn.execute(select(func.max(Product.id))).scalar() or 0) + 1
+        skus = dict(conn.execute(select(Product.sku, Product.id)).all()) if fixtures else {}
+
+    if rows:
+        from benchmarks.generator import generate_logs, generate_products
+
+        if next_id > 1:
+            raise ValueError("Database đã có sản phẩm, dùng --reset để sinh dữ liệu giả lập")
+        return load_data(generate_products(rows, seed, now), generate_logs(rows, seed, now), fast)
+
+    products, logs = [], []
+    for path in fixtures:
+        file_products, file_logs = read_fixture(path)
+        products.extend(file_products)
+        logs.extend(file_logs)
+    product_rows = list(_product_rows(products, next_id, skus, now))
+    return load_data(product_rows, _log_rows(logs, skus, now), fast)
+
 def main():
     """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Khởi tạo database và nạp dữ liệu")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--rows", type=int, help="Sinh N sản phẩm giả lập (kèm log), cần database trống")
+    source.add_argument("--fixtures", nargs="+", metavar="FILE", help="Nạp sản phẩm/log từ file JSON, CSV hoặc XLSX")
+    parser.add_argument("--seed", type=int, default=42, help="Seed cho dữ liệu giả lập")
+    parser.add_argument("--fast", action="store_true",
+                        help="Tắt journal/fsync và tạo index sau khi nạp (chỉ dùng cho database mới)")
+    parser.add_argument("--reset", action="store_true", help="Xóa toàn bộ dữ liệu trước khi nạp")
+    args = parser.parse_args()
+
     print("🚀 Khởi tạo hệ thống Quản lý Bán hàng...")
-    
+
+    if args.reset:
+        print("🗑️  Đang xóa dữ liệu cũ...")
+        reset_db()
+
     # Khởi tạo database
     print("📊 Đang khởi tạo database...")
     init_db()
     print("✅ Database đã được khởi tạo thành công!")
-    
-    # Tạo dữ liệu mẫu
-    create_sample_data()
-    
+
+    if args.rows or args.fixtures:
+        print("📦 Đang nạp dữ liệu...")
+        started = time.perf_counter()
+        try:
+            counts = seed_database(args.rows, args.seed, args.fixtures or (), args.fast)
+        except (ValueError, OSError) as e:
+            print(f"❌ Lỗi khi nạp dữ liệu: {e}")
+            sys.exit(1)
+        finally:
+            # Các lô đã ghi vẫn còn: báo worker đang chạy xóa cache sản phẩm
+            bump_version()
+        elapsed = time.perf_counter() - started
+        print(f"🎉 Đã nạp {counts['products']} sản phẩm, {counts['logs']} log trong {elapsed:.1f}s")
+    else:
+        # Tạo dữ liệu mẫu
+        create_sample_data()
+        bump_version()
+
     print("\n🎯 Hệ thống đã sẵn sàng!")
     print("📝 Để chạy ứng dụng, sử dụng lệnh:")
     print("   python -m uvicorn app.main:app --reload --host 0.0.0.0 --port 8000")
     print("\n🌐 Truy cập: http://localhost:8000")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()